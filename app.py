@@ -3,23 +3,31 @@
 """
 
 import streamlit as st
-import json
-import re
-from pathlib import Path
+import os
+import time
+import uuid
 from datetime import datetime
-from copy import deepcopy
-from docx import Document
-from docx.oxml import OxmlElement
-from docx.oxml.ns import qn
 import pandas as pd
 from io import BytesIO
-
-# הגדרות בסיסיות
-DATA_DIR = Path(__file__).parent / "data"
-PUBLISHERS_FILE = DATA_DIR / "publishers.json"
-
-# יצירת תיקיות אם לא קיימות
-DATA_DIR.mkdir(exist_ok=True)
+from rules import format_rule_line, parse_dictionary_file_detailed, template_error
+from storage import ConcurrentModificationError, load_publishers, save_publishers
+from matcher import MATCH_PREFIXES, MATCH_SUBSTRING, MATCH_WORDS, dictionary_hash, get_matcher
+from processing import ProcessingStats, preview_docx_stream
+from result_cache import document_hash
+from jobs import JOB_DONE, JOB_FAILED, JOB_QUEUED, JOB_RUNNING, Job, get_job_queue
+
+# טבלה גדולה - מוצגים זמני בדיקה ושמירה
+LARGE_TABLE_ROWS = 5000
+
+# קובץ לוג (JSON lines) לנתוני הביצועים של כל עיבוד - אופציונלי
+STATS_LOG_FILE = os.environ.get("BOOK_EDITOR_STATS_LOG")
+
+PHASE_LABELS = {
+    "load": "קריאת המסמך",
+    "match": "חיפוש התאמות",
+    "rebuild": "בניית runs",
+    "serialize": "כתיבת הפלט",
+}
 
 # הגדרת העמוד
 st.set_page_config(
@@ -174,78 +182,55 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-def load_publishers() -> dict:
-    """טעינת נתוני הוצאות הספרים"""
-    if PUBLISHERS_FILE.exists():
-        with open(PUBLISHERS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
+class DictionaryIndex:
+    """
+    מילון עם אינדקס: מקור → מיקום ברשימה.
+    בדיקת כפילות והוספה ב-O(1) במקום סריקה של כל הרשימה.
+    מחיקות נעשות בטבלת העריכה (השוואה מול הרשימה השמורה), לא דרך האינדקס.
+    """
 
+    def __init__(self, dictionary: list):
+        self._entries = []
+        self._positions = {}
+        for entry in dictionary:
+            self.add(entry["from"], entry["to"], entry.get("priority", 0))
 
-def save_publishers(data: dict):
-    """שמירת נתוני הוצאות הספרים"""
-    with open(PUBLISHERS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    def __contains__(self, from_text: str) -> bool:
+        return from_text in self._positions
 
+    def __len__(self) -> int:
+        return len(self._positions)
 
-def parse_dictionary_file(content: str) -> list:
-    """
-    פענוח קובץ מילון בפורמט:
-    "מילה למציאה" "מילה להחלפה"
-    """
-    entries = []
-    lines = content.strip().split('\n')
-    pattern = r'"([^"]+)"\s+"([^"]+)"'
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        match = re.match(pattern, line)
-        if match:
-            entries.append({"from": match.group(1), "to": match.group(2)})
-    
-    return entries
+    def find(self, from_text: str) -> int:
+        """בדיקה האם ערך קיים במילון, מחזיר מספר שורה או -1"""
+        if from_text not in self._positions:
+            return -1
+        return self._positions[from_text] + 1
 
+    def add(self, from_text: str, to_text: str, priority: int = 0) -> bool:
+        """הוספת ערך בסוף המילון, אם המקור לא קיים כבר. מחזיר האם נוסף"""
+        if from_text in self._positions:
+            return False
+        self._positions[from_text] = len(self._entries)
+        entry = {"from": from_text, "to": to_text}
+        if priority:
+            entry["priority"] = priority
+        self._entries.append(entry)
+        return True
+
+    def to_list(self) -> list:
+        """רשימת המילון לשמירה, לפי הסדר"""
+        return list(self._entries)
 
-def parse_dictionary_file_detailed(content: str) -> list:
-    """
-    פענוח קובץ מילון עם זיהוי שורות תקינות ולא תקינות.
-    מחזיר רשימה של כל השורות עם סטטוס תקינות.
-    """
-    entries = []
-    lines = content.strip().split('\n')
-    pattern = r'"([^"]+)"\s+"([^"]+)"'
-    
-    for line_num, line in enumerate(lines, start=1):
-        stripped = line.strip()
-        if not stripped:
-            continue
-        match = re.match(pattern, stripped)
-        if match:
-            entries.append({
-                "line": line_num,
-                "from": match.group(1),
-                "to": match.group(2),
-                "valid": True
-            })
-        else:
-            entries.append({
-                "line": line_num,
-                "from": stripped,
-                "to": "",
-                "valid": False
-            })
-    
-    return entries
 
+def clean_text_column(series: pd.Series) -> pd.Series:
+    """ערכי עמודת טקסט לאחר strip, עם מחרוזת ריקה במקום ערכים חסרים"""
+    return series.where(series.notna(), "").astype(str).str.strip()
 
-def find_duplicate_entry(dictionary: list, from_text: str) -> int:
-    """בדיקה האם ערך קיים במילון, מחזיר מספר שורה או -1"""
-    for idx, entry in enumerate(dictionary):
-        if entry["from"] == from_text:
-            return idx + 1
-    return -1
+
+def clean_priority_column(series: pd.Series) -> pd.Series:
+    """ערכי עמודת העדיפות כמספרים שלמים, עם 0 במקום ערכים חסרים או לא מספריים"""
+    return pd.to_numeric(series, errors="coerce").fillna(0).astype(int)
 
 
 def add_to_deletion_history(publishers: dict, publisher_name: str, entries: list):
@@ -256,202 +241,156 @@ def add_to_deletion_history(publishers: dict, publisher_name: str, entries: list
     history = publishers[publisher_name]["deletion_history"]
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
-    for entry in entries:
-        history.insert(0, {
-            "from": entry["from"],
-            "to": entry["to"],
-            "deleted_at": timestamp
-        })
-    
-    # שמירת רק 100 הערכים האחרונים
-    publishers[publisher_name]["deletion_history"] = history[:100]
-
-
-def process_document(doc: Document, dictionary: list) -> tuple[Document, list]:
-    """עיבוד מסמך Word והחלפת מילים עם סימון עקוב אחר שינויים (Track Changes)"""
-    changes = []
-    author = "עורך ספרים"
-    date_str = datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
-    rev_id = 1
-
-    W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
-    XML_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
-
-    def make_run(text, rpr=None, is_del_text=False):
-        """יצירת אלמנט run חדש עם טקסט ועיצוב"""
-        r = OxmlElement('w:r')
-        if rpr is not None:
-            r.append(deepcopy(rpr))
-        tag = 'w:delText' if is_del_text else 'w:t'
-        t = OxmlElement(tag)
-        t.set(XML_SPACE, 'preserve')
-        t.text = text
-        r.append(t)
-        return r
-
-    def process_paragraph(paragraph, para_idx):
-        nonlocal rev_id
-        p_elem = paragraph._element
-
-        # איסוף כל ה-runs מהפסקה
-        run_elements = [child for child in p_elem if child.tag == f'{{{W_NS}}}r']
-        if not run_elements:
-            return
-
-        # בניית מפת מיקומים: לכל run שומרים טקסט, עיצוב ומיקום בטקסט המלא
-        runs_data = []
-        pos = 0
-        for rel in run_elements:
-            t_elements = rel.findall(f'{{{W_NS}}}t')
-            run_text = ''.join((t.text or '') for t in t_elements)
-            rpr = rel.find(f'{{{W_NS}}}rPr')
-            runs_data.append({
-                'element': rel,
-                'text': run_text,
-                'start': pos,
-                'end': pos + len(run_text),
-                'rPr': deepcopy(rpr) if rpr is not None else None
-            })
-            pos += len(run_text)
-
-        full_text = ''.join(rd['text'] for rd in runs_data)
-        if not full_text:
-            return
-
-        # מציאת כל ההחלפות בטקסט המקורי
-        replacements = []
-        for entry in dictionary:
-            from_text = entry["from"]
-            to_text = entry["to"]
-            search_start = 0
-            while True:
-                found = full_text.find(from_text, search_start)
-                if found == -1:
-                    break
-                replacements.append((found, found + len(from_text), from_text, to_text))
-                search_start = found + len(from_text)
-
-        if not replacements:
-            return
-
-        # מיון לפי מיקום וסינון חפיפות
-        replacements.sort()
-        filtered = []
-        last_end = 0
-        for r in replacements:
-            if r[0] >= last_end:
-                filtered.append(r)
-                last_end = r[1]
-        replacements = filtered
-
-        # רישום שינויים ללוג
-        for _, _, from_text, to_text in replacements:
-            changes.append({
-                "שורה": para_idx,
-                "מקור": from_text,
-                "הוחלף ל": to_text
-            })
-
-        # בניית רשימת מקטעים: keep (ללא שינוי) או replace (החלפה)
-        segments = []
-        cur = 0
-        for start, end, from_text, to_text in replacements:
-            if cur < start:
-                segments.append(('keep', cur, start))
-            segments.append(('replace', start, end, from_text, to_text))
-            cur = end
-        if cur < len(full_text):
-            segments.append(('keep', cur, len(full_text)))
-
-        def get_portions(char_start, char_end):
-            """קבלת חלקי runs (עיצוב + טקסט) עבור טווח תווים"""
-            portions = []
-            for rd in runs_data:
-                o_start = max(char_start, rd['start'])
-                o_end = min(char_end, rd['end'])
-                if o_start < o_end:
-                    txt = rd['text'][o_start - rd['start']:o_end - rd['start']]
-                    portions.append((rd['rPr'], txt))
-            return portions
-
-        # מציאת נקודת הכנסה - שומר על אלמנטים לפני ה-runs (כמו pPr)
-        ref_element = None
-        for child in p_elem:
-            if child.tag == f'{{{W_NS}}}r':
-                break
-            ref_element = child
-
-        # הסרת כל ה-runs הישנים מהפסקה
-        for rd in runs_data:
-            p_elem.remove(rd['element'])
-
-        # חישוב מיקום הכנסה
-        if ref_element is not None:
-            insert_idx = list(p_elem).index(ref_element) + 1
+    # האחרון שנמחק ראשון - ושמירת רק 100 הערכים האחרונים
+    new_history = [
+        {"from": entry["from"], "to": entry["to"], "deleted_at": timestamp}
+        for entry in entries[::-1][:100]
+    ]
+    publishers[publisher_name]["deletion_history"] = (new_history + history)[:100]
+
+
+def render_processing_stats(stats: ProcessingStats):
+    """פאנל מתקפל עם מונים וזמנים לכל שלב בעיבוד"""
+    with st.expander("⏱️ ביצועי העיבוד"):
+        cols = st.columns(4)
+        cols[0].metric("פסקאות", f"{stats.paragraphs:,}")
+        cols[1].metric("התאמות", f"{stats.matches:,}")
+        cols[2].metric("runs שנבנו מחדש", f"{stats.runs_rebuilt:,}")
+        cols[3].metric("זמן כולל", f"{stats.total_s:.2f} ש'")
+        st.caption(
+            f"פסקאות שהשתנו: {stats.paragraphs_changed:,} · "
+            f"התאמות שנפסלו בגלל חפיפה: {stats.overlap_dropped:,} · "
+            f"runs חדשים: {stats.runs_created:,} · העתקות עיצוב (deepcopy): {stats.deepcopies:,}"
+        )
+        timings = pd.DataFrame([
+            {"שלב": PHASE_LABELS[name], "זמן (ms)": round(seconds * 1000, 1)}
+            for name, seconds in stats.timings.items()
+        ])
+        st.dataframe(timings, width="stretch", hide_index=True)
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def preview_document(document_digest: str, publisher: str, dictionary_digest: str, match_mode: str,
+                     normalize: bool, _data: bytes, _dictionary: list) -> tuple[list, float]:
+    """תצוגה מקדימה של מסמך - נשמרת לפי תוכן המסמך, המילון ואפשרויות ההתאמה"""
+    stats = ProcessingStats()
+    matcher = get_matcher(publisher, _dictionary, match_mode, normalize)
+    results = preview_docx_stream(BytesIO(_data), _dictionary, matcher, stats)
+    return results, stats.total_s
+
+
+def render_impact_preview(uploaded_files: list, publisher: str, dictionary: list, match_mode: str, normalize: bool):
+    """כמה החלפות כל כלל יבצע בכל קובץ, עם דוגמאות - סריקה בלבד, לפני השליחה לעיבוד"""
+    with st.expander("🔍 תצוגה מקדימה - החלפות צפויות", expanded=True):
+        dictionary_digest = dictionary_hash(dictionary)
+        for uploaded_file in uploaded_files:
+            data = uploaded_file.getvalue()
+            try:
+                results, seconds = preview_document(document_hash(data), publisher, dictionary_digest, match_mode,
+                                                    normalize, data, dictionary)
+            except Exception as e:
+                st.error(f"❌ {uploaded_file.name}: {str(e) or type(e).__name__}")
+                continue
+            total = sum(row["מופעים"] for row in results)
+            st.markdown(f"**{uploaded_file.name}** · {total:,} החלפות לפי {len(results):,} כללים · {seconds:.2f} ש'")
+            if results:
+                table = pd.DataFrame([{**row, "דוגמאות": "  ·  ".join(row["דוגמאות"])} for row in results])
+                st.dataframe(table, width="stretch", hide_index=True)
+            else:
+                st.info("לא נמצאו מילים להחלפה במסמך לפי המילון הנבחר.")
+
+
+JOB_STATUS_LABELS = {
+    JOB_QUEUED: "⏳ ממתין",
+    JOB_RUNNING: "⚙️ בעיבוד",
+    JOB_DONE: "✅ הושלם",
+    JOB_FAILED: "❌ נכשל",
+}
+
+MATCH_MODE_LABELS = {
+    MATCH_SUBSTRING: "כל מופע",
+    MATCH_WORDS: "מילים שלמות",
+    MATCH_PREFIXES: "מילים שלמות + אותיות שימוש (ו/ה/ב/כ/ל/מ/ש)",
+}
+
+
+def render_job(job: Job):
+    """שורה בתור העיבוד: מצב, התקדמות, ולעבודה שהסתיימה - הורדה ולוג שינויים"""
+    col_name, col_status, col_action = st.columns([3, 4, 2])
+    col_name.markdown(f"**{job.file_name}**  \n{job.publisher}")
+    
+    with col_status:
+        if job.status == JOB_RUNNING:
+            st.progress(job.progress, text=f"{job.stats.paragraphs:,} / {job.paragraphs_total:,} פסקאות")
+        elif job.status == JOB_DONE and job.from_cache:
+            st.markdown(f"{JOB_STATUS_LABELS[job.status]} · {len(job.changes)} החלפות · ⚡ מהמטמון")
+        elif job.status == JOB_DONE:
+            status = f"{JOB_STATUS_LABELS[job.status]} · {len(job.changes)} החלפות · {job.stats.total_s:.1f} ש'"
+            if job.paragraphs_reused:
+                status += f" · ♻️ {job.paragraphs_reused:,} פסקאות ללא סריקה חוזרת"
+            st.markdown(status)
+        elif job.status == JOB_FAILED:
+            st.markdown(f"{JOB_STATUS_LABELS[job.status]}: {job.error}")
         else:
-            insert_idx = 0
-
-        # בניית אלמנטים חדשים לפי המקטעים
-        for segment in segments:
-            if segment[0] == 'keep':
-                _, seg_start, seg_end = segment
-                for rpr, text in get_portions(seg_start, seg_end):
-                    p_elem.insert(insert_idx, make_run(text, rpr))
-                    insert_idx += 1
-
-            elif segment[0] == 'replace':
-                _, seg_start, seg_end, from_text, to_text = segment
-
-                # אלמנט מחיקה <w:del> - הטקסט המקורי עם העיצוב המקורי
-                del_el = OxmlElement('w:del')
-                del_el.set(qn('w:id'), str(rev_id))
-                del_el.set(qn('w:author'), author)
-                del_el.set(qn('w:date'), date_str)
-                rev_id += 1
-
-                del_portions = get_portions(seg_start, seg_end)
-                for rpr, text in del_portions:
-                    del_el.append(make_run(text, rpr, is_del_text=True))
-
-                p_elem.insert(insert_idx, del_el)
-                insert_idx += 1
-
-                # אלמנט הוספה <w:ins> - הטקסט החדש עם עיצוב מה-run הראשון
-                ins_el = OxmlElement('w:ins')
-                ins_el.set(qn('w:id'), str(rev_id))
-                ins_el.set(qn('w:author'), author)
-                ins_el.set(qn('w:date'), date_str)
-                rev_id += 1
-
-                first_rpr = del_portions[0][0] if del_portions else None
-                ins_el.append(make_run(to_text, first_rpr))
-
-                p_elem.insert(insert_idx, ins_el)
-                insert_idx += 1
-
-    # עיבוד כל הפסקאות בגוף המסמך
-    processed = set()
-    para_idx = 0
-
-    for paragraph in doc.paragraphs:
-        para_idx += 1
-        elem_id = id(paragraph._element)
-        if elem_id not in processed:
-            processed.add(elem_id)
-            process_paragraph(paragraph, para_idx)
-
-    # עיבוד פסקאות בטבלאות
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for paragraph in cell.paragraphs:
-                    para_idx += 1
-                    elem_id = id(paragraph._element)
-                    if elem_id not in processed:
-                        processed.add(elem_id)
-                        process_paragraph(paragraph, para_idx)
-
-    return doc, changes
+            st.markdown(JOB_STATUS_LABELS[job.status])
+    
+    with col_action:
+        if job.status == JOB_DONE:
+            st.download_button(
+                label="📥 הורד",
+                data=job.output,
+                file_name=job.output_name,
+                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                key=f"download_job_{job.id}",
+                use_container_width=True
+            )
+        if job.finished and st.button("🗑️ הסר", key=f"remove_job_{job.id}", use_container_width=True):
+            get_job_queue().remove(job.id)
+            st.session_state.jobs.remove(job.id)
+            st.rerun()
+    
+    if job.status == JOB_DONE:
+        with st.expander(f"📊 לוג שינויים - {job.file_name}"):
+            if job.changes:
+                st.dataframe(pd.DataFrame(job.changes), width="stretch", hide_index=True)
+            else:
+                st.info("לא נמצאו מילים להחלפה במסמך לפי המילון הנבחר.")
+        if not job.from_cache:
+            render_processing_stats(job.stats)
+
+
+def render_job_queue():
+    """תור העיבוד של הסשן - מתרענן כל שנייה כל עוד יש עבודות פעילות"""
+    queue = get_job_queue()
+    jobs = [queue.get(job_id) for job_id in st.session_state.jobs]
+    # עבודות שנמחקו מהזיכרון (תור מלא) יוצאות מהרשימה
+    st.session_state.jobs = [job.id for job in jobs if job is not None]
+    active = any(job is not None and not job.finished for job in jobs)
+    
+    @st.fragment(run_every=1 if active else None)
+    def job_list():
+        st.markdown("### 📋 תור עיבוד")
+        current = [queue.get(job_id) for job_id in st.session_state.jobs]
+        for job in current:
+            if job is not None:
+                render_job(job)
+        # כל העבודות הסתיימו - ריצה מלאה אחת כדי לעצור את הרענון
+        if active and all(job is None or job.finished for job in current):
+            st.rerun()
+    
+    job_list()
+
+
+def save_publishers_or_report(publishers: dict) -> bool:
+    """שמירת הנתונים, עם הודעת שגיאה אם עורך אחר שינה בינתיים את אותם ערכים"""
+    try:
+        save_publishers(publishers)
+        return True
+    except ConcurrentModificationError as e:
+        st.error("⚠️ עורך אחר שינה בינתיים את אותם ערכים - השינויים לא נשמרו. רענן את הדף ונסה שוב.")
+        for conflict in e.conflicts:
+            st.caption(conflict)
+        return False
 
 
 def main():
@@ -467,6 +406,10 @@ def main():
         st.session_state.confirm_clear_dictionary = False
     if "show_history" not in st.session_state:
         st.session_state.show_history = False
+    if "jobs" not in st.session_state:
+        st.session_state.jobs = []
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
     
     tab1, tab2 = st.tabs(["🔄 עיבוד מסמך", "⚙️ ניהול מילונים"])
     
@@ -475,10 +418,11 @@ def main():
         col1, col2 = st.columns([2, 1])
         
         with col1:
-            uploaded_file = st.file_uploader(
-                "📤 העלאת קובץ Word",
+            uploaded_files = st.file_uploader(
+                "📤 העלאת קבצי Word",
                 type=["docx"],
-                help="העלה קובץ Word מתורגם לעיבוד"
+                accept_multiple_files=True,
+                help="העלה קובץ Word מתורגם אחד או יותר לעיבוד"
             )
         
         with col2:
@@ -494,53 +438,53 @@ def main():
                 st.warning("אין הוצאות ספרים מוגדרות. עבור לטאב 'ניהול מילונים' להוספה.")
                 selected_publisher = None
         
-        if uploaded_file and selected_publisher:
+        if uploaded_files and selected_publisher:
             st.markdown("---")
             dictionary = publishers[selected_publisher].get("dictionary", [])
             st.markdown(f"""
             <div class="info-box">
                 <strong>🏢 הוצאה נבחרת:</strong> {selected_publisher}<br>
-                <strong>📖 מספר כללים במילון:</strong> {len(dictionary)}
+                <strong>📖 מספר כללים במילון:</strong> {len(dictionary)}<br>
+                <strong>📄 קבצים לעיבוד:</strong> {len(uploaded_files)}
             </div>
             """, unsafe_allow_html=True)
             
+            minimal_edits = st.checkbox(
+                "עריכה מינימלית",
+                value=True,
+                help="פיצול רק של ה-runs שבהם נמצאה התאמה. שאר הטקסט, הסימניות, השדות ועוגני ההערות נשארים כמו שהם"
+            )
+            
+            match_mode = st.radio(
+                "מצב התאמה",
+                options=list(MATCH_MODE_LABELS),
+                format_func=MATCH_MODE_LABELS.get,
+                horizontal=True,
+                help="מילים שלמות: \"הינה\" לא יוחלף בתוך מילה ארוכה יותר. "
+                     "עם אותיות שימוש: כלל אחד מכסה גם \"והינה\", \"שהינה\" וכו' - אין צורך בכלל לכל צורה"
+            )
+            
+            normalize = st.checkbox(
+                "התעלמות מניקוד וממקפים",
+                value=False,
+                help="כלל נמצא גם כשבטקסט יש ניקוד, מקף רגיל (-) במקום מקף עברי (־) או צורת Unicode אחרת. "
+                     "ההחלפה מסומנת על התווים המקוריים, כולל הניקוד"
+            )
+            
+            render_impact_preview(uploaded_files, selected_publisher, dictionary, match_mode, normalize)
+            
             if st.button("🚀 בצע עיבוד", type="primary", use_container_width=True):
-                with st.spinner("מעבד את המסמך..."):
-                    doc = Document(uploaded_file)
-                    processed_doc, changes = process_document(doc, dictionary)
-                    
-                    if changes:
-                        st.markdown(f"""
-                        <div class="success-box">
-                            <strong>✅ העיבוד הושלם בהצלחה!</strong><br>
-                            בוצעו {len(changes)} החלפות במסמך.
-                        </div>
-                        """, unsafe_allow_html=True)
-                        
-                        st.markdown("### 📊 לוג שינויים")
-                        df = pd.DataFrame(changes)
-                        st.dataframe(df, width="stretch", hide_index=True)
-                        
-                        output = BytesIO()
-                        processed_doc.save(output)
-                        output.seek(0)
-                        
-                        original_name = uploaded_file.name.replace(".docx", "")
-                        st.download_button(
-                            label="📥 הורד קובץ מעובד",
-                            data=output,
-                            file_name=f"{original_name}_מעובד.docx",
-                            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                            type="primary",
-                            use_container_width=True
-                        )
-                    else:
-                        st.markdown("""
-                        <div class="warning-box">
-                            <strong>ℹ️ לא נמצאו התאמות</strong><br>
-                            לא נמצאו מילים להחלפה במסמך לפי המילון הנבחר.
-                        </div>
-                        """, unsafe_allow_html=True)
+                queue = get_job_queue()
+                for uploaded_file in uploaded_files:
+                    job = queue.submit(uploaded_file.name, uploaded_file.getvalue(), selected_publisher,
+                                       dictionary, minimal_edits, STATS_LOG_FILE, match_mode, normalize,
+                                       session=st.session_state.session_id)
+                    st.session_state.jobs.append(job.id)
+                st.toast(f"{len(uploaded_files)} קבצים נוספו לתור העיבוד")
+        
+        if st.session_state.jobs:
+            st.markdown("---")
+            render_job_queue()
     
     # ===== טאב ניהול מילונים =====
     with tab2:
@@ -589,7 +533,8 @@ def main():
                         "dictionary": [],
                         "deletion_history": []
                     }
-                    save_publishers(publishers)
+                    if not save_publishers_or_report(publishers):
+                        st.stop()
                     st.success(f"הוצאה '{new_publisher_name}' נוספה!")
                     st.rerun()
             
@@ -613,7 +558,8 @@ def main():
                         st.error("הוצאה בשם זה כבר קיימת")
                     else:
                         publishers[new_name] = publishers.pop(selected_for_edit)
-                        save_publishers(publishers)
+                        if not save_publishers_or_report(publishers):
+                            st.stop()
                         st.success(f"השם שונה ל-'{new_name}'")
                         st.rerun()
             
@@ -634,7 +580,8 @@ def main():
                     with col_yes:
                         if st.button("✅ כן, מחק", type="primary", use_container_width=True):
                             del publishers[selected_for_edit]
-                            save_publishers(publishers)
+                            if not save_publishers_or_report(publishers):
+                                st.stop()
                             st.session_state.confirm_delete = False
                             st.success("ההוצאה נמחקה!")
                             st.rerun()
@@ -698,10 +645,10 @@ def main():
                             selected_rows = edited_history[edited_history["בחר"] == True]
                             if not selected_rows.empty:
                                 restored_count = 0
+                                dictionary_index = DictionaryIndex(dictionary)
                                 for _, row in selected_rows.iterrows():
-                                    # בדיקה שלא קיים כבר
-                                    if find_duplicate_entry(dictionary, row["מקור"]) < 0:
-                                        dictionary.append({"from": row["מקור"], "to": row["יעד"]})
+                                    # הוספה רק אם לא קיים כבר
+                                    if dictionary_index.add(row["מקור"], row["יעד"]):
                                         restored_count += 1
                                     
                                     # הסרה מההיסטוריה
@@ -713,8 +660,9 @@ def main():
                                 publishers[selected_for_edit]["deletion_history"] = [
                                     h for h in deletion_history if h is not None
                                 ]
-                                publishers[selected_for_edit]["dictionary"] = dictionary
-                                save_publishers(publishers)
+                                publishers[selected_for_edit]["dictionary"] = dictionary_index.to_list()
+                                if not save_publishers_or_report(publishers):
+                                    st.stop()
                                 st.success(f"שוחזרו {restored_count} ערכים!")
                                 st.session_state.show_history = False
                                 st.rerun()
@@ -732,10 +680,11 @@ def main():
                 st.markdown("**רשימת מילים קיימת:**")
                 
                 if dictionary:
-                    df_dict = pd.DataFrame([
-                        {"#": i + 1, "יעד": entry["to"], "מקור": entry["from"]}
-                        for i, entry in enumerate(dictionary)
-                    ])
+                    df_dict = pd.DataFrame(dictionary, columns=["priority", "to", "from"]).rename(
+                        columns={"priority": "עדיפות", "to": "יעד", "from": "מקור"}
+                    )
+                    df_dict["עדיפות"] = clean_priority_column(df_dict["עדיפות"])
+                    df_dict.insert(0, "#", range(1, len(df_dict) + 1))
                     
                     edited_df = st.data_editor(
                         df_dict,
@@ -746,6 +695,10 @@ def main():
                             "#": st.column_config.NumberColumn("#", width="small", disabled=True),
                             "מקור": st.column_config.TextColumn("מקור", width="medium"),
                             "יעד": st.column_config.TextColumn("יעד", width="medium"),
+                            "עדיפות": st.column_config.NumberColumn(
+                                "עדיפות", width="small", step=1, default=0,
+                                help="בין כללים שנמצאו באותו מקום בטקסט - בעל העדיפות הגבוהה מוחלף, ובעדיפות שווה - הארוך"
+                            ),
                         },
                         num_rows="dynamic",
                         key="dict_editor"
@@ -754,7 +707,7 @@ def main():
                     st.caption(f"סה״כ {len(dictionary)} ערכים במילון")
                     
                     # הורדת רשימת מילים לקובץ
-                    dict_lines = [f'"{e["from"]}" "{e["to"]}"' for e in dictionary]
+                    dict_lines = [format_rule_line(e) for e in dictionary]
                     dict_content = "\n".join(dict_lines)
                     st.download_button(
                         "📥 הורד רשימת מילים לקובץ",
@@ -764,40 +717,63 @@ def main():
                         use_container_width=True
                     )
                     
-                    # בדיקת כפילויות
-                    source_values = []
-                    duplicates = []
-                    for idx, row in edited_df.iterrows():
-                        if pd.notna(row["מקור"]) and str(row["מקור"]).strip():
-                            source_val = str(row["מקור"]).strip()
-                            if source_val in source_values:
-                                duplicates.append(source_val)
-                            source_values.append(source_val)
+                    # בדיקת כפילויות (וקטורית)
+                    check_started = time.perf_counter()
+                    sources = clean_text_column(edited_df["מקור"])
+                    non_empty_sources = sources[sources != ""]
+                    duplicates = non_empty_sources[non_empty_sources.duplicated()].tolist()
+                    check_ms = (time.perf_counter() - check_started) * 1000
                     
                     if duplicates:
                         for dup_val in duplicates:
                             st.error(f"⚠️ כפילות: הערך '{dup_val}' מופיע יותר מפעם אחת ברשימה")
                     
+                    if len(edited_df) >= LARGE_TABLE_ROWS:
+                        st.caption(f"⏱️ בדיקת כפילויות: {check_ms:.0f} ms")
+                        if "table_save_timing" in st.session_state:
+                            st.caption(st.session_state.pop("table_save_timing"))
+                    
                     save_disabled = len(duplicates) > 0
                     
                     if st.button("💾 שמור שינויים בטבלה", type="primary", use_container_width=True, disabled=save_disabled):
-                        new_dictionary = []
-                        for _, row in edited_df.iterrows():
-                            if pd.notna(row["מקור"]) and pd.notna(row["יעד"]) and str(row["מקור"]).strip() and str(row["יעד"]).strip():
-                                new_dictionary.append({
-                                    "from": str(row["מקור"]).strip(),
-                                    "to": str(row["יעד"]).strip()
-                                })
+                        save_started = time.perf_counter()
+                        targets = clean_text_column(edited_df["יעד"])
+                        priorities = clean_priority_column(edited_df["עדיפות"])
+                        valid = (sources != "") & (targets != "")
+                        new_df = pd.DataFrame({"from": sources[valid], "to": targets[valid]})
+                        new_dictionary = new_df.to_dict("records")
+                        for entry, priority in zip(new_dictionary, priorities[valid].tolist()):
+                            if priority:
+                                entry["priority"] = priority
+                        
+                        # כללי תבנית לא תקינים - כמו בהוספה ידנית ובייבוא, השמירה נעצרת
+                        invalid_templates = [
+                            (row, entry["from"], error)
+                            for row, entry in zip(new_df.index, new_dictionary)
+                            if (error := template_error(entry["from"], entry["to"]))
+                        ]
+                        if invalid_templates:
+                            for row, from_text, error in invalid_templates:
+                                st.error(f"⚠️ שורה {edited_df.index.get_loc(row) + 1} ('{from_text}'): "
+                                         f"כלל תבנית לא תקין - {error}. השינויים לא נשמרו.")
+                            st.stop()
                         
-                        # בדיקת ערכים שנמחקו
-                        new_sources = {e["from"] for e in new_dictionary}
-                        deleted_entries = [e for e in dictionary if e["from"] not in new_sources]
+                        # בדיקת ערכים שנמחקו (anti-join לפי המקור)
+                        old_df = pd.DataFrame(dictionary, columns=["from", "to"])
+                        deleted_entries = old_df[~old_df["from"].isin(new_df["from"])].to_dict("records")
+                        diff_ms = (time.perf_counter() - save_started) * 1000
                         
                         if deleted_entries:
                             add_to_deletion_history(publishers, selected_for_edit, deleted_entries)
                         
                         publishers[selected_for_edit]["dictionary"] = new_dictionary
-                        save_publishers(publishers)
+                        if not save_publishers_or_report(publishers):
+                            st.stop()
+                        if len(edited_df) >= LARGE_TABLE_ROWS:
+                            save_ms = (time.perf_counter() - save_started) * 1000
+                            st.session_state.table_save_timing = (
+                                f"⏱️ שמירה אחרונה: השוואה {diff_ms:.0f} ms, סה״כ {save_ms:.0f} ms"
+                            )
                         st.success("השינויים נשמרו!")
                         st.rerun()
                     
@@ -817,7 +793,8 @@ def main():
                                 # שמירה בהיסטוריה
                                 add_to_deletion_history(publishers, selected_for_edit, dictionary)
                                 publishers[selected_for_edit]["dictionary"] = []
-                                save_publishers(publishers)
+                                if not save_publishers_or_report(publishers):
+                                    st.stop()
                                 st.session_state.confirm_clear_dictionary = False
                                 st.success("המילון נמחק!")
                                 st.rerun()
@@ -841,15 +818,19 @@ def main():
                 if st.button("הוסף למילון", key="add_to_dict", use_container_width=True):
                     if not (new_from.strip() and new_to.strip()):
                         st.error("יש למלא את שני השדות: מקור ויעד")
+                    elif template_error(new_from.strip(), new_to.strip()):
+                        st.error(f"⚠️ כלל תבנית לא תקין: {template_error(new_from.strip(), new_to.strip())}")
                     else:
-                        existing_row = find_duplicate_entry(dictionary, new_from.strip())
+                        dictionary_index = DictionaryIndex(dictionary)
+                        existing_row = dictionary_index.find(new_from.strip())
                         
                         if existing_row > 0:
                             st.error(f"⚠️ הערך '{new_from}' כבר קיים במילון בשורה {existing_row}")
                         else:
-                            dictionary.append({"from": new_from.strip(), "to": new_to.strip()})
-                            publishers[selected_for_edit]["dictionary"] = dictionary
-                            save_publishers(publishers)
+                            dictionary_index.add(new_from.strip(), new_to.strip())
+                            publishers[selected_for_edit]["dictionary"] = dictionary_index.to_list()
+                            if not save_publishers_or_report(publishers):
+                                st.stop()
                             st.success("הערך נוסף!")
                             st.rerun()
             else:
@@ -862,7 +843,7 @@ def main():
             # === טעינה מקובץ - תמיד זמין ===
             st.markdown("---")
             st.markdown("**📁 טעינה מקובץ**")
-            st.caption('כל שורה בפורמט: "מקור" "יעד"')
+            st.caption('כל שורה בפורמט: "מקור" "יעד". כלל תבנית: "{אחת|שתים|שתיים=שתים} עשרה" "{}־עשרה"')
             
             uploaded_dict = st.file_uploader(
                 "העלה קובץ מילון",
@@ -883,7 +864,11 @@ def main():
                     
                     if invalid_entries_list:
                         invalid_lines_str = ", ".join(str(e["line"]) for e in invalid_entries_list)
-                        st.warning(f"⚠️ {len(invalid_entries_list)} שורות לא תקינות (שורות: {invalid_lines_str}). ניתן לערוך ולתקן בטבלה.")
+                        template_errors = "".join(
+                            f"\n- שורה {e['line']}: {e['error']}"
+                            for e in invalid_entries_list if e["to"]
+                        )
+                        st.warning(f"⚠️ {len(invalid_entries_list)} שורות לא תקינות (שורות: {invalid_lines_str}). ניתן לערוך ולתקן בטבלה.{template_errors}")
                     
                     st.success(f"✅ {len(valid_entries_list)} ערכים תקינים מתוך {len(file_entries)} שורות")
                     
@@ -893,6 +878,7 @@ def main():
                             "#": e["line"],
                             "מקור": e["from"],
                             "יעד": e["to"],
+                            "עדיפות": e["priority"],
                         }
                         for e in file_entries
                     ])
@@ -906,17 +892,19 @@ def main():
                             "#": st.column_config.NumberColumn("#", width="small", disabled=True),
                             "מקור": st.column_config.TextColumn("מקור", width="medium"),
                             "יעד": st.column_config.TextColumn("יעד", width="medium"),
+                            "עדיפות": st.column_config.NumberColumn("עדיפות", width="small", step=1),
                         },
                         key="file_preview_editor"
                     )
                     
                     # הורדת קובץ מתוקן
                     corrected_lines = []
-                    for _, row in edited_file_df.iterrows():
+                    file_priorities = clean_priority_column(edited_file_df["עדיפות"]).tolist()
+                    for (_, row), priority in zip(edited_file_df.iterrows(), file_priorities):
                         from_val = str(row["מקור"]).strip() if pd.notna(row["מקור"]) else ""
                         to_val = str(row["יעד"]).strip() if pd.notna(row["יעד"]) else ""
                         if from_val and to_val:
-                            corrected_lines.append(f'"{from_val}" "{to_val}"')
+                            corrected_lines.append(format_rule_line({"from": from_val, "to": to_val, "priority": priority}))
                     
                     if corrected_lines:
                         corrected_content = "\n".join(corrected_lines)
@@ -933,19 +921,25 @@ def main():
                     
                     # חישוב ערכים תקינים מהטבלה הערוכה
                     entries_to_process = []
-                    for _, row in edited_file_df.iterrows():
+                    for (_, row), priority in zip(edited_file_df.iterrows(), file_priorities):
                         from_val = str(row["מקור"]).strip() if pd.notna(row["מקור"]) else ""
                         to_val = str(row["יעד"]).strip() if pd.notna(row["יעד"]) else ""
-                        if from_val and to_val:
-                            entries_to_process.append({"from": from_val, "to": to_val})
+                        if from_val and to_val and template_error(from_val, to_val) is None:
+                            entries_to_process.append({"from": from_val, "to": to_val, "priority": priority})
                     
                     invalid_in_table = len(edited_file_df) - len(entries_to_process)
                     
                     if selected_for_edit:
-                        current_dict = publishers[selected_for_edit].get("dictionary", [])
+                        dictionary_index = DictionaryIndex(publishers[selected_for_edit].get("dictionary", []))
                         
-                        dup_entries = [e for e in entries_to_process if find_duplicate_entry(current_dict, e["from"]) >= 0]
-                        new_unique_entries = [e for e in entries_to_process if find_duplicate_entry(current_dict, e["from"]) < 0]
+                        # ערך שכבר קיים במילון (או שחוזר בקובץ עצמו) ידולג
+                        dup_entries = []
+                        new_unique_entries = []
+                        for e in entries_to_process:
+                            if dictionary_index.add(e["from"], e["to"], e["priority"]):
+                                new_unique_entries.append(e)
+                            else:
+                                dup_entries.append(e)
                         
                         st.markdown(f"**📊 סיכום הוספה להוצאה '{selected_for_edit}':**")
                         if new_unique_entries:
@@ -965,9 +959,9 @@ def main():
                                 type="primary",
                                 use_container_width=True
                             ):
-                                current_dict.extend(new_unique_entries)
-                                publishers[selected_for_edit]["dictionary"] = current_dict
-                                save_publishers(publishers)
+                                publishers[selected_for_edit]["dictionary"] = dictionary_index.to_list()
+                                if not save_publishers_or_report(publishers):
+                                    st.stop()
                                 st.success(f"נוספו {len(new_unique_entries)} ערכים בהצלחה!")
                                 st.rerun()
                         elif entries_to_process and not new_unique_entries:
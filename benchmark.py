@@ -0,0 +1,285 @@
+"""
+מדידת ביצועים של מנוע ההחלפות על ספרים ומילונים סינתטיים
+
+שימוש:
+    python benchmark.py
+    python benchmark.py --paragraphs 5000 --rules 100 1000 10000 50000 -o bench.json
+    python benchmark.py -o new.json --baseline bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from docx import Document
+from matcher import MATCH_MODES, MATCH_SUBSTRING, DictionaryMatcher
+from processing import ProcessingStats, process_document, process_docx_stream
+from rules import expand_rule, parse_dictionary_file
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+RULES_DIR = Path(__file__).parent / "list_of_rules"
+DEFAULT_RULE_COUNTS = [100, 1000, 10000, 50000]
+
+# מילות מילוי לטקסט, בנוסף למילים מקבצי הכללים
+FILLER_WORDS = (
+    "הוא היא הם אני את זה של על עם לא כי גם אבל רק עוד כבר אז היה היתה "
+    "בית ספר עיר דרך יום לילה שנה זמן אדם ילד אישה איש עולם מים אור ראש יד "
+    "אמר הלך ראה ידע חשב שאל ענה ישב קם בא יצא חזר נתן לקח כתב קרא"
+).split()
+HEBREW_LETTERS = "אבגדהוזחטיכלמנסעפצקרשת"
+
+
+def load_seed_rules() -> list:
+    """כל הכללים מקבצי הדוגמה ב-list_of_rules (ללא כפילויות מקור, כללי תבנית פרושים לצורות)"""
+    rules, seen = [], set()
+    for path in sorted(RULES_DIR.glob("*.txt")):
+        for entry in parse_dictionary_file(path.read_text(encoding="utf-8")):
+            for from_text, to_text in expand_rule(entry["from"], entry["to"]):
+                if from_text not in seen:
+                    seen.add(from_text)
+                    rules.append({"from": from_text, "to": to_text})
+    return rules
+
+
+def make_dictionary(size: int, seed_rules: list, rnd: random.Random) -> list:
+    """מילון בגודל נתון: כללי הדוגמה ואחריהם צירופים סינתטיים בסגנון "X Y" → "X־Y" """
+    dictionary = seed_rules[:size]
+    seen = {e["from"] for e in dictionary}
+    while len(dictionary) < size:
+        first = "".join(rnd.choice(HEBREW_LETTERS) for _ in range(rnd.randint(2, 6)))
+        second = "".join(rnd.choice(HEBREW_LETTERS) for _ in range(rnd.randint(2, 6)))
+        from_text = f"{first} {second}"
+        if from_text not in seen:
+            seen.add(from_text)
+            dictionary.append({"from": from_text, "to": f"{first}־{second}"})
+    return dictionary
+
+
+def make_manuscript(path: Path, paragraphs: int, runs: int, tables: int, seed_rules: list, rnd: random.Random):
+    """ספר סינתטי: פסקאות עם כמה runs בעיצוב מעורב, וטבלאות לאורך המסמך"""
+    words = FILLER_WORDS + [w for e in seed_rules for w in e["from"].split() + e["to"].split()]
+
+    def sentence(count):
+        return " ".join(rnd.choice(words) for _ in range(count))
+
+    doc = Document()
+    table_every = paragraphs // tables if tables else 0
+    for i in range(paragraphs):
+        p = doc.add_paragraph()
+        for _ in range(runs):
+            r = p.add_run(sentence(rnd.randint(3, 10)) + " ")
+            r.bold = rnd.random() < 0.2
+            r.italic = rnd.random() < 0.1
+        if table_every and (i + 1) % table_every == 0:
+            table = doc.add_table(rows=4, cols=3)
+            for row in table.rows:
+                for cell in row.cells:
+                    cell.text = sentence(rnd.randint(2, 6))
+    doc.save(path)
+
+
+def make_fragmented_manuscript(path: Path, paragraphs: int, runs: int, seed_rules: list, rnd: random.Random):
+    """
+    מקרה קיצון: כל פסקה מפוצלת לעשרות-מאות runs של 1-3 תווים
+    (כמו ש-Word מפצל טקסט עברי בגלל rsid ובדיקת איות)
+    """
+    words = FILLER_WORDS + [w for e in seed_rules for w in e["from"].split() + e["to"].split()]
+    doc = Document()
+    for _ in range(paragraphs):
+        text = " ".join(rnd.choice(words) for _ in range(runs))
+        p = doc.add_paragraph()
+        pos = 0
+        for _ in range(runs):
+            size = rnd.randint(1, 3)
+            r = p.add_run(text[pos:pos + size])
+            r.bold = rnd.random() < 0.3
+            pos += size
+        if pos < len(text):
+            p.add_run(text[pos:])
+    doc.save(path)
+
+
+def _peak_rss_mb():
+    """שיא הזיכרון של התהליך (MB), אם ידוע במערכת ההפעלה"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS מחזיר בתים, לינוקס קילובתים
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _pipeline(path: Path, dictionary: list, matcher: DictionaryMatcher, minimal_edits: bool) -> ProcessingStats:
+    """הרצה אחת של המנוע המלא (פתיחה, עיבוד ושמירה), עם זמן לכל שלב"""
+    stats = ProcessingStats()
+    with stats.phase("load"):
+        doc = Document(path)
+    process_document(doc, dictionary, matcher, stats, minimal_edits)
+    with stats.phase("serialize"):
+        doc.save(BytesIO())
+    return stats
+
+
+def _best_timings(runs: list) -> dict:
+    """הזמן הטוב ביותר לכל שלב מבין החזרות"""
+    return {name: min(stats.timings[name] for stats in runs) for name in ProcessingStats.PHASES}
+
+
+def run_case(path: str, dictionary: list, paragraphs: int, repeat: int, minimal_edits: bool = False,
+             match_mode: str = MATCH_SUBSTRING, normalize: bool = False) -> dict:
+    """מדידת מקרה אחד (ספר + מילון) - רץ בתהליך נפרד כדי ששיא הזיכרון יהיה של המקרה בלבד"""
+    path = Path(path)
+    size_mb = path.stat().st_size / (1024 * 1024)
+
+    started = time.perf_counter()
+    matcher = DictionaryMatcher(dictionary, match_mode, normalize)
+    compile_s = time.perf_counter() - started
+
+    runs = [_pipeline(path, dictionary, matcher, minimal_edits) for _ in range(repeat)]
+    stream_runs = []
+    for _ in range(repeat):
+        stats = ProcessingStats()
+        process_docx_stream(path, BytesIO(), dictionary, matcher, stats, minimal_edits)
+        stream_runs.append(stats)
+
+    # מעבר נוסף תחת tracemalloc (איטי יותר - לא נכלל בזמנים)
+    tracemalloc.start()
+    _pipeline(path, dictionary, matcher, minimal_edits)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings = _best_timings(runs)
+    total = sum(timings.values())
+    stream_timings = _best_timings(stream_runs)
+    stream_s = min(stats.total_s for stats in stream_runs)
+    counters = runs[0].to_dict()
+    del counters["timings_s"], counters["total_s"]
+    return {
+        "rules": len(dictionary),
+        "compile_s": round(compile_s, 4),
+        "phases_s": {name: round(value, 4) for name, value in timings.items()},
+        "total_s": round(total, 4),
+        "stream_phases_s": {name: round(value, 4) for name, value in stream_timings.items()},
+        "stream_s": round(stream_s, 4),
+        "paragraphs_per_s": round(paragraphs / total, 1),
+        "mb_per_s": round(size_mb / total, 3),
+        "stream_paragraphs_per_s": round(paragraphs / stream_s, 1),
+        "stream_mb_per_s": round(size_mb / stream_s, 3),
+        **counters,
+        "peak_rss_mb": _peak_rss_mb(),
+        "peak_traced_mb": round(traced_peak / (1024 * 1024), 1),
+    }
+
+
+def compare_with_baseline(results: list, baseline_path: Path):
+    """הדפסת יחס זמנים מול ריצה קודמת (לפי תרחיש ומספר הכללים)"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r.get("scenario", "book"), r["rules"]): r for r in json.load(f)["results"]}
+    print(f"\nהשוואה מול {baseline_path} (מעל 1.00 = איטי יותר):")
+    for result in results:
+        old = baseline.get((result["scenario"], result["rules"]))
+        if old is None:
+            continue
+        ratios = ", ".join(
+            f"{phase} {result['phases_s'][phase] / old['phases_s'][phase]:.2f}"
+            for phase in result["phases_s"] if old["phases_s"].get(phase)
+        )
+        print(f"  {result['scenario']} {result['rules']:>6} כללים: סה\"כ {result['total_s'] / old['total_s']:.2f}, "
+              f"זורם {result['stream_s'] / old['stream_s']:.2f} ({ratios})")
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="מדידת ביצועים על ספר ומילונים סינתטיים")
+    parser.add_argument("--paragraphs", type=int, default=2000, help="מספר פסקאות בספר")
+    parser.add_argument("--runs", type=int, default=4, help="מספר runs בכל פסקה")
+    parser.add_argument("--tables", type=int, default=20, help="מספר טבלאות בספר")
+    parser.add_argument("--rules", type=int, nargs="+", default=DEFAULT_RULE_COUNTS,
+                        help="גדלי המילונים למדידה")
+    parser.add_argument("--repeat", type=int, default=3, help="חזרות לכל מקרה (נלקח הזמן הטוב ביותר)")
+    parser.add_argument("--seed", type=int, default=0, help="זרע אקראי (לספר ולמילונים)")
+    parser.add_argument("--fragmented-paragraphs", type=int, default=100,
+                        help="פסקאות במקרה הקיצון של runs מפוצלים (0 - דילוג)")
+    parser.add_argument("--fragmented-runs", type=int, default=300, help="runs בכל פסקה מפוצלת")
+    parser.add_argument("--fragmented-rules", type=int, default=1000, help="גודל המילון במקרה הקיצון")
+    parser.add_argument("--minimal-edits", action="store_true", help="מדידה במצב עריכה מינימלית")
+    parser.add_argument("--match", choices=MATCH_MODES, default=MATCH_SUBSTRING, help="מצב ההתאמה למדידה")
+    parser.add_argument("--normalize", action="store_true", help="מדידה עם התאמה מנורמלת")
+    parser.add_argument("-o", "--output", default="benchmark.json", help="קובץ התוצאות (JSON)")
+    parser.add_argument("--baseline", help="קובץ תוצאות קודם להשוואה")
+    args = parser.parse_args(argv)
+
+    rnd = random.Random(args.seed)
+    seed_rules = load_seed_rules()
+    results = []
+
+    def measure(scenario, path, count, paragraphs):
+        dictionary = make_dictionary(count, seed_rules, random.Random(args.seed + count))
+        # תהליך חדש לכל מקרה
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            result = pool.submit(run_case, str(path), dictionary, paragraphs, args.repeat,
+                                 args.minimal_edits, args.match, args.normalize).result()
+        result = {"scenario": scenario, **result}
+        results.append(result)
+        phases = ", ".join(f"{k} {v:.3f}" for k, v in result["phases_s"].items())
+        print(f"{count:>6} כללים: {result['paragraphs_per_s']:.0f} פסקאות/ש' "
+              f"({result['mb_per_s']:.2f} MB/s), זורם {result['stream_paragraphs_per_s']:.0f} פסקאות/ש', "
+              f"{result['matches']} החלפות, זיכרון {result['peak_rss_mb']} MB [{phases}]")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "manuscript.docx"
+        make_manuscript(path, args.paragraphs, args.runs, args.tables, seed_rules, rnd)
+        size_mb = path.stat().st_size / (1024 * 1024)
+        print(f"ספר סינתטי: {args.paragraphs} פסקאות, {args.runs} runs לפסקה, "
+              f"{args.tables} טבלאות ({size_mb:.2f} MB)")
+        for count in args.rules:
+            measure("book", path, count, args.paragraphs)
+
+        if args.fragmented_paragraphs:
+            path = Path(tmp) / "fragmented.docx"
+            make_fragmented_manuscript(path, args.fragmented_paragraphs, args.fragmented_runs, seed_rules, rnd)
+            print(f"\nפסקאות מפוצלות: {args.fragmented_paragraphs} פסקאות, {args.fragmented_runs} runs לפסקה")
+            measure("fragmented", path, args.fragmented_rules, args.fragmented_paragraphs)
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "paragraphs": args.paragraphs,
+            "runs_per_paragraph": args.runs,
+            "tables": args.tables,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "fragmented_paragraphs": args.fragmented_paragraphs,
+            "fragmented_runs": args.fragmented_runs,
+            "minimal_edits": args.minimal_edits,
+            "match_mode": args.match,
+            "normalize": args.normalize,
+            "manuscript_mb": round(size_mb, 3),
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"התוצאות נשמרו ב-{args.output}")
+
+    if args.baseline:
+        compare_with_baseline(results, Path(args.baseline))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""
+מצב אצווה (ללא ממשק) - עיבוד תיקייה שלמה של קבצי Word במקביל
+
+שימוש:
+    python cli.py "בוקטיק" chapters/
+    python cli.py "בוקטיק" "chapters/*.docx" --log changes.csv
+    python cli.py "בוקטיק" chapters/ --dry-run
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from matcher import MATCH_MODES, MATCH_SUBSTRING, DictionaryMatcher
+from storage import load_publishers
+from processing import ProcessingStats, preview_docx_stream, process_docx_stream
+
+OUTPUT_SUFFIX = "_מעובד"
+
+# מספר הכללים שמודפסים בסיכום של הרצת ניסיון
+DRY_RUN_TOP_RULES = 30
+
+# האוטומט של המילון - נבנה פעם אחת בכל תהליך עובד
+_worker_dictionary = None
+_worker_matcher = None
+
+
+def _init_worker(dictionary: list, match_mode: str = MATCH_SUBSTRING, normalize: bool = False):
+    """אתחול תהליך עובד: הידור המילון פעם אחת לכל התהליך"""
+    global _worker_dictionary, _worker_matcher
+    _worker_dictionary = dictionary
+    _worker_matcher = DictionaryMatcher(dictionary, match_mode, normalize)
+
+
+def _process_file(input_path: str, output_path: str, minimal_edits: bool = True) -> tuple[str, list, ProcessingStats]:
+    """עיבוד קובץ בודד בתהליך עובד, מחזיר (נתיב, שינויים, נתוני ביצועים)"""
+    stats = ProcessingStats()
+    changes = process_docx_stream(input_path, output_path, _worker_dictionary, _worker_matcher, stats,
+                                  minimal_edits)
+    return input_path, changes, stats
+
+
+def _preview_file(input_path: str) -> tuple[str, list, ProcessingStats]:
+    """סריקה בלבד של קובץ בודד בתהליך עובד, מחזיר (נתיב, ספירה לפי כלל, נתוני ביצועים)"""
+    stats = ProcessingStats()
+    results = preview_docx_stream(input_path, _worker_dictionary, _worker_matcher, stats)
+    return input_path, results, stats
+
+
+def print_dry_run_summary(results: dict, top: int = DRY_RUN_TOP_RULES):
+    """סיכום הרצת ניסיון: הכללים עם הכי הרבה החלפות צפויות בכל הקבצים יחד, עם דוגמה"""
+    totals = {}
+    for rows in results.values():
+        for row in rows:
+            key = (row["מקור"], row["הוחלף ל"])
+            count, sample = totals.get(key, (0, None))
+            totals[key] = (count + row["מופעים"], sample or next(iter(row["דוגמאות"]), None))
+    ordered = sorted(totals.items(), key=lambda item: (-item[1][0], item[0]))
+    for (from_text, to_text), (count, sample) in ordered[:top]:
+        print(f"{count:>8,}  \"{from_text}\" → \"{to_text}\"  {sample or ''}")
+    if len(ordered) > top:
+        print(f"... ועוד {len(ordered) - top} כללים")
+
+
+def collect_input_files(sources: list) -> list:
+    """איסוף קבצי docx מתיקיות, תבניות glob ונתיבים בודדים (ללא קבצים שכבר עובדו)"""
+    files = []
+    for source in sources:
+        path = Path(source)
+        if path.is_dir():
+            matches = sorted(path.glob("*.docx"))
+        else:
+            matches = sorted(Path(p) for p in glob.glob(source))
+        for match in matches:
+            # דילוג על קבצי נעילה של Word ועל פלטים קודמים
+            if match.name.startswith("~$") or match.stem.endswith(OUTPUT_SUFFIX):
+                continue
+            if match.suffix.lower() == ".docx" and match not in files:
+                files.append(match)
+    return files
+
+
+def write_change_log(log_path: Path, rows: list):
+    """כתיבת לוג שינויים משותף לכל הקבצים (CSV או JSON לפי הסיומת)"""
+    if log_path.suffix.lower() == ".json":
+        with open(log_path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+    else:
+        # utf-8-sig כדי ש-Excel יזהה עברית
+        with open(log_path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["קובץ", "חלק", "שורה", "מקור", "הוחלף ל"])
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="עיבוד אצווה של קבצי Word לפי מילון של הוצאת ספרים")
+    parser.add_argument("publisher", help="שם הוצאת הספרים")
+    parser.add_argument("sources", nargs="+", help="תיקיות, תבניות glob או קבצי docx")
+    parser.add_argument("-o", "--output-dir", help="תיקיית פלט (ברירת מחדל: ליד כל קובץ מקור)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="מספר תהליכים במקביל (ברירת מחדל: מספר הליבות)")
+    parser.add_argument("--log", default="changes.csv", help="קובץ לוג שינויים משותף (.csv או .json)")
+    parser.add_argument("--full-rebuild", action="store_true",
+                        help="בנייה מחדש של כל ה-runs בפסקה שיש בה התאמה (ברירת מחדל: פיצול רק של ה-runs המושפעים)")
+    parser.add_argument("--match", choices=MATCH_MODES, default=MATCH_SUBSTRING,
+                        help="מצב התאמה: substring - כל מופע (ברירת מחדל), words - מילים שלמות בלבד, "
+                             "prefixes - מילים שלמות כולל אותיות השימוש ו/ה/ב/כ/ל/מ/ש")
+    parser.add_argument("--normalize", action="store_true",
+                        help="התאמה בהתעלמות מניקוד, מסוג המקף (- / ־) ומצורת ה-Unicode")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="הרצת ניסיון: ספירת ההחלפות הצפויות לכל כלל, בלי לכתוב קבצי פלט או לוג")
+    parser.add_argument("--stats-log", help="קובץ JSON lines להוספת נתוני הביצועים של כל קובץ")
+    args = parser.parse_args(argv)
+
+    publishers = load_publishers()
+    if args.publisher not in publishers:
+        print(f"הוצאה '{args.publisher}' לא נמצאה. הוצאות קיימות: {', '.join(publishers)}", file=sys.stderr)
+        return 2
+    dictionary = publishers[args.publisher].get("dictionary", [])
+
+    files = collect_input_files(args.sources)
+    if not files:
+        print("לא נמצאו קבצי docx לעיבוד", file=sys.stderr)
+        return 1
+
+    output_dir = Path(args.output_dir) if args.output_dir else None
+    if output_dir and not args.dry_run:
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+    jobs = max(1, min(args.jobs, len(files)))
+    print(f"מעבד {len(files)} קבצים עם {len(dictionary)} כללים ({jobs} תהליכים)")
+
+    started = time.perf_counter()
+    results = {}
+    failed = 0
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(dictionary, args.match, args.normalize)) as pool:
+        futures = {}
+        for path in files:
+            out_dir = output_dir or path.parent
+            output_path = out_dir / f"{path.stem}{OUTPUT_SUFFIX}.docx"
+            if args.dry_run:
+                futures[pool.submit(_preview_file, str(path))] = path
+            else:
+                futures[pool.submit(_process_file, str(path), str(output_path), not args.full_rebuild)] = path
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                _, changes, stats = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"✗ {path.name}: {e}", file=sys.stderr)
+                continue
+            results[path] = changes
+            if args.stats_log:
+                stats.append_to_log(args.stats_log, file=str(path), publisher=args.publisher, rules=len(dictionary))
+            if args.dry_run:
+                print(f"✓ {path.name}: {stats.matches} החלפות צפויות, {stats.total_s:.2f} שניות")
+            else:
+                print(f"✓ {path.name}: {len(changes)} החלפות, {stats.total_s:.2f} שניות")
+
+    if args.dry_run:
+        print_dry_run_summary(results)
+        total = time.perf_counter() - started
+        print(f"הרצת ניסיון הסתיימה: {len(results)} קבצים, "
+              f"{sum(row['מופעים'] for rows in results.values() for row in rows)} החלפות צפויות, {total:.2f} שניות")
+        return 1 if failed else 0
+
+    # לוג משותף לפי סדר הקבצים המקורי
+    rows = []
+    for path in files:
+        for change in results.get(path, []):
+            rows.append({"קובץ": path.name, **change})
+    write_change_log(Path(args.log), rows)
+
+    total = time.perf_counter() - started
+    print(f"הסתיים: {len(results)} קבצים, {len(rows)} החלפות, {total:.2f} שניות. לוג: {args.log}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
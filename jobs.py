@@ -0,0 +1,178 @@
+"""
+תור עיבוד מסמכים ברקע - כמה קבצים במקביל, עם דיווח התקדמות ושמירת התוצאות להורדה
+"""
+
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from matcher import MATCH_SUBSTRING, IncrementalMatcher, effective_rules, get_matcher, matching_options_key
+from processing import ProcessingStats, count_paragraphs, process_docx_stream
+from result_cache import (document_hash, load_paragraph_index, load_result, result_key, store_paragraph_index,
+                          store_result)
+
+# מספר העבודות שרצות במקביל (משותף לכל הסשנים), מספר העבודות שהסתיימו שנשמרות בזיכרון לכל סשן,
+# והזמן שאחריו עבודה שהסתיימה נמחקת בכל מקרה (סשן שנסגר) - התוצאה עדיין במטמון שעל הדיסק
+MAX_JOB_WORKERS = max(1, min(4, os.cpu_count() or 1))
+MAX_FINISHED_JOBS = 50
+MAX_FINISHED_AGE_S = 6 * 3600
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class Job:
+    """עבודת עיבוד של מסמך אחד: קלט, מצב, התקדמות ותוצאה"""
+
+    def __init__(self, job_id: int, file_name: str, data: bytes, publisher: str, dictionary: list,
+                 minimal_edits: bool = True, match_mode: str = MATCH_SUBSTRING, normalize: bool = False,
+                 session: str = None):
+        self.id = job_id
+        self.session = session
+        self.file_name = file_name
+        self.publisher = publisher
+        self.dictionary = dictionary
+        self.minimal_edits = minimal_edits
+        self.match_mode = match_mode
+        self.normalize = normalize
+        self.data = data
+        self.status = JOB_QUEUED
+        self.stats = ProcessingStats()
+        self.paragraphs_total = 0
+        self.output = None
+        self.changes = []
+        self.error = None
+        self.from_cache = False
+        self.paragraphs_reused = 0
+        self.created_at = time.time()
+        self.finished_at = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JOB_DONE, JOB_FAILED)
+
+    @property
+    def progress(self) -> float:
+        """חלק הפסקאות שעובדו (0-1), לפי מונה הפסקאות של העיבוד"""
+        if self.status == JOB_DONE:
+            return 1.0
+        if not self.paragraphs_total:
+            return 0.0
+        return min(1.0, self.stats.paragraphs / self.paragraphs_total)
+
+    @property
+    def output_name(self) -> str:
+        return f"{self.file_name.removesuffix('.docx')}_מעובד.docx"
+
+
+class JobQueue:
+    """
+    תור עבודות עם מאגר threads. הממשק מוסיף עבודות ושואל את מצבן;
+    העבודות שהסתיימו נשמרות עד max_finished לכל סשן (הישנות ביותר של אותו סשן נמחקות),
+    כך שסשן עמוס אינו מוחק תוצאות של משתמש אחר, ולכל היותר max_age שניות.
+    """
+
+    def __init__(self, max_workers: int = MAX_JOB_WORKERS, max_finished: int = MAX_FINISHED_JOBS,
+                 max_age: float = MAX_FINISHED_AGE_S):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="book-editor-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.max_finished = max_finished
+        self.max_age = max_age
+
+    def submit(self, file_name: str, data: bytes, publisher: str, dictionary: list,
+               minimal_edits: bool = True, stats_log: str = None, match_mode: str = MATCH_SUBSTRING,
+               normalize: bool = False, session: str = None) -> Job:
+        """הוספת מסמך לתור - מחזיר את העבודה מיד, העיבוד רץ ברקע. session - מזהה הסשן ששלח אותה"""
+        with self._lock:
+            job = Job(next(self._ids), file_name, data, publisher, list(dictionary), minimal_edits, match_mode,
+                      normalize, session)
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job, stats_log)
+        return job
+
+    def get(self, job_id: int) -> Job:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def remove(self, job_id: int):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.finished:
+                del self._jobs[job_id]
+
+    def _run(self, job: Job, stats_log: str = None):
+        job.status = JOB_RUNNING
+        try:
+            # אותו מסמך עם אותו מילון כבר עובד - התוצאה מהמטמון
+            digest = document_hash(job.data)
+            key = result_key(digest, job.dictionary, job.minimal_edits, job.match_mode, job.normalize)
+            cached = load_result(key)
+            if cached is not None:
+                job.output, job.changes = cached
+                job.from_cache = True
+                job.status = JOB_DONE
+                return
+
+            job.paragraphs_total = count_paragraphs(BytesIO(job.data))
+            # המסמך כבר עובד עם גרסה אחרת של המילון - סריקה חוזרת רק של פסקאות שהשינוי נוגע להן
+            rules = effective_rules(job.dictionary)
+            options_key = matching_options_key(job.match_mode, job.normalize)
+            previous_rules, previous_index = load_paragraph_index(digest, options_key) or (None, None)
+            matcher = IncrementalMatcher(get_matcher(job.publisher, job.dictionary, job.match_mode, job.normalize),
+                                         rules, previous_rules, previous_index)
+            output = BytesIO()
+            job.changes = process_docx_stream(BytesIO(job.data), output, job.dictionary, matcher,
+                                              job.stats, job.minimal_edits)
+            job.output = output.getvalue()
+            job.paragraphs_reused = matcher.reused
+            try:
+                store_result(key, job.output, job.changes)
+                store_paragraph_index(digest, rules, matcher.index, options_key)
+            except OSError:
+                pass  # מטמון שאינו זמין (דיסק מלא, הרשאות) אינו מכשיל את העיבוד
+            job.status = JOB_DONE
+            if stats_log:
+                job.stats.append_to_log(stats_log, file=job.file_name, publisher=job.publisher,
+                                        rules=len(job.dictionary))
+        except Exception as e:
+            job.error = str(e) or type(e).__name__
+            job.status = JOB_FAILED
+        finally:
+            # הקלט והמילון אינם נחוצים עוד
+            job.data = None
+            job.dictionary = []
+            job.finished_at = time.time()
+            self._trim()
+
+    def _trim(self):
+        """מחיקת העבודות שהסתיימו מעבר למגבלה של כל סשן, ושל עבודות שהסתיימו לפני יותר מ-max_age"""
+        with self._lock:
+            now = time.time()
+            by_session = {}
+            for job in sorted((j for j in self._jobs.values() if j.finished), key=lambda j: j.finished_at or now):
+                if now - (job.finished_at or now) > self.max_age:
+                    del self._jobs[job.id]
+                else:
+                    by_session.setdefault(job.session, []).append(job)
+            for finished in by_session.values():
+                for job in finished[:max(0, len(finished) - self.max_finished)]:
+                    del self._jobs[job.id]
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """תור העבודות המשותף לתהליך (נוצר בשימוש הראשון)"""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+        return _job_queue
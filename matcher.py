@@ -0,0 +1,407 @@
+"""
+התאמה מרובת תבניות במעבר יחיד (אוטומט Aho–Corasick) עבור מילוני ההוצאות
+"""
+
+import hashlib
+import json
+import re
+import sys
+import threading
+import unicodedata
+from collections import OrderedDict
+from rules import expand_rule
+
+# תקרת זיכרון (משוערת) למטמון האוטומטים המהודרים, משותף לכל הסשנים בתהליך
+MATCHER_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# מצבי התאמה: כל מופע של המחרוזת, מילים שלמות בלבד, או מילים שלמות עם אותיות השימוש
+MATCH_SUBSTRING = "substring"
+MATCH_WORDS = "words"
+MATCH_PREFIXES = "prefixes"
+MATCH_MODES = (MATCH_SUBSTRING, MATCH_WORDS, MATCH_PREFIXES)
+
+# אותיות השימוש שיכולות להיצמד לתחילת מילה (ו, ה, ב, כ, ל, מ, ש), ומספרן המרבי ברצף ("וכשה")
+HEBREW_PREFIX_LETTERS = frozenset("והבכלמש")
+MAX_PREFIX_LETTERS = 3
+
+# נרמול: תווים שמוסרים מהתצוגה המנורמלת (סימני כיווניות, מקף רך) וסוגי המקף שמתאחדים למקף העברי
+_IGNORED_CHARS = frozenset("\u200e\u200f\u00ad")
+_HYPHENS = {"-": "־", "\u2010": "־", "\u2011": "־"}
+# תווים שדורשים נרמול (ניקוד וטעמים, מקפים, תווים שמוסרים) - בלעדיהם ובצורת NFD הטקסט נשאר כמו שהוא
+_NEEDS_NORMALIZATION = re.compile("[\u0591-\u05bd\u05bf-\u05c7\u00ad\u200e\u200f\u2010\u2011-]")
+
+
+def _is_word_char(text: str, i: int) -> bool:
+    """
+    האם התו במיקום i הוא חלק ממילה: אות, ספרה, ניקוד/טעמים, גרש/גרשיים.
+    מירכאות ואפוסטרוף רגילים נחשבים חלק ממילה רק בין שתי אותיות (צה"ל, ג'ירפה).
+    """
+    if i < 0 or i >= len(text):
+        return False
+    ch = text[i]
+    if ch.isalnum() or ch in "׳״":
+        return True
+    if ch in "'\"":
+        return 0 < i < len(text) - 1 and text[i - 1].isalpha() and text[i + 1].isalpha()
+    return unicodedata.category(ch) == "Mn"
+
+
+def _is_hebrew_mark(ch: str) -> bool:
+    """ניקוד או טעם מקרא (לא המקף ולא סימני הפיסוק שבאותו טווח)"""
+    return "\u0591" <= ch <= "\u05c7" and unicodedata.category(ch) == "Mn"
+
+
+def normalize_text(text: str) -> tuple:
+    """
+    תצוגה מנורמלת של הטקסט להתאמה: צורת NFD, ללא ניקוד וטעמים, כל סוגי המקף כמקף עברי (־),
+    ללא סימני כיווניות ומקף רך.
+    מחזיר (טקסט, starts, ends) - לכל תו בתצוגה, טווח התווים המקוריים שלו (כולל הניקוד שהוסר אחריו);
+    כשאין מה לנרמל: (text, None, None).
+    """
+    if not _NEEDS_NORMALIZATION.search(text) and unicodedata.is_normalized("NFD", text):
+        return text, None, None
+    chars, starts, ends = [], [], []
+    for i, ch in enumerate(text):
+        if ch in _IGNORED_CHARS:
+            continue
+        for part in (ch if ch.isascii() else unicodedata.normalize("NFD", ch)):
+            if _is_hebrew_mark(part):
+                # הניקוד שייך לאות שלפניו - נכלל בטווח שלה
+                if ends:
+                    ends[-1] = i + 1
+                continue
+            chars.append(_HYPHENS.get(part, part))
+            starts.append(i)
+            ends.append(i + 1)
+    return "".join(chars), starts, ends
+
+
+def effective_rules(dictionary: list) -> dict:
+    """
+    הכללים בפועל: מקור → (יעד, עדיפות), ללא מקור ריק. כללי תבנית נפרשים לכל הצורות שלהם.
+    כללים עם אותו מקור - נשמר בעל העדיפות הגבוהה, ואז היעד הקטן ביותר.
+    """
+    targets = {}
+    for entry in dictionary:
+        priority = entry.get("priority") or 0
+        for from_text, to_text in expand_rule(entry["from"], entry["to"]):
+            if not from_text:
+                continue
+            current = targets.get(from_text)
+            if current is None or (-priority, to_text) < (-current[1], current[0]):
+                targets[from_text] = (to_text, priority)
+    return targets
+
+
+class DictionaryMatcher:
+    """
+    אוטומט Aho–Corasick הנבנה פעם אחת לכל מילון.
+    סריקה אחת של הטקסט מוצאת את ההחלפות של כל הכללים, כבר ללא חפיפות (scan).
+    כללי תבנית מהודרים לתוך אותו trie (הצורות חולקות צמתים), כך שאין עלות סריקה לכל כלל.
+    match_mode - MATCH_WORDS: מופע נמצא רק כשהוא מילה שלמה (גבולות המילה נבדקים בזמן הסריקה);
+    MATCH_PREFIXES: כמו MATCH_WORDS, ובנוסף לפני המילה מותרות אותיות שימוש ("והינה" ← "הינה").
+    אותיות השימוש נשארות בטקסט - ההחלפה היא של המילה עצמה בלבד.
+    normalize - ההתאמה נעשית על התצוגה המנורמלת של הטקסט ושל הכללים (normalize_text), והמופעים
+    ממופים חזרה לתווים המקוריים. מופע שהטקסט המקורי שלו כבר זהה ליעד אינו מוחזר.
+    rules - כללים שכבר חושבו (effective_rules) במקום המילון; אינם נפרשים שוב.
+    """
+
+    def __init__(self, dictionary: list, match_mode: str = MATCH_SUBSTRING, normalize: bool = False,
+                 rules: dict = None):
+        if match_mode not in MATCH_MODES:
+            raise ValueError(f"מצב התאמה לא מוכר: {match_mode}")
+        self.match_mode = match_mode
+        self.normalize = normalize
+        rules = (effective_rules(dictionary) if rules is None else rules).items()
+        if normalize:
+            # כלל שאחרי הנרמול לא נשאר בו דבר (ניקוד בלבד) - אינו נכלל
+            keyed = [(normalize_text(f)[0], f, target) for f, target in rules]
+            keyed = [rule for rule in keyed if rule[0]]
+        else:
+            keyed = [(f, f, target) for f, target in rules]
+        self.patterns = [(f, to_text) for _, f, (to_text, _) in keyed]
+        # המחרוזת שנבנית ב-trie לכל כלל (המקור, או המקור המנורמל) ואורכה
+        self._keys = [key for key, _, _ in keyed]
+        self._lengths = [len(key) for key in self._keys]
+        # דירוג בין מופעים שמתחילים באותו מקום: עדיפות, ואז אורך
+        self._ranks = [(priority, len(key)) for key, _, (_, priority) in keyed]
+        # לכל כלל: האם הוא מתחיל / מסתיים בתו של מילה (רק שם נבדק גבול מילה)
+        self._edges = [(_is_word_char(k, 0), _is_word_char(k, len(k) - 1)) for k in self._keys]
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        self._depth = [0]
+        self._build()
+        self.size_bytes = self._estimate_size()
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def _build(self):
+        """בניית ה-trie וקישורי הכישלון"""
+        goto, out, depth = self._goto, self._out, self._depth
+        for pid, key in enumerate(self._keys):
+            node = 0
+            for ch in key:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    out.append(())
+                    depth.append(depth[node] + 1)
+                node = nxt
+            out[node] = out[node] + (pid,)
+
+        # מעבר BFS: קישור כישלון לכל צומת ואיחוד הפלטים של הסיומות
+        fail = self._fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for node in queue:
+            for ch, nxt in goto[node].items():
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] = out[nxt] + out[fail[nxt]]
+                queue.append(nxt)
+
+    def _estimate_size(self) -> int:
+        """הערכת נפח הזיכרון של האוטומט (לצורך תקרת המטמון)"""
+        size = sys.getsizeof(self._goto) + sys.getsizeof(self._fail) + sys.getsizeof(self._out)
+        size += sys.getsizeof(self._depth) + sys.getsizeof(self._ranks) + len(self._ranks) * sys.getsizeof((0, 0))
+        size += sum(sys.getsizeof(g) for g in self._goto)
+        size += sum(sys.getsizeof(o) for o in self._out)
+        size += sum(sys.getsizeof(f) + sys.getsizeof(t) for f, t in self.patterns)
+        if self.normalize:
+            size += sum(sys.getsizeof(k) for k in self._keys)
+        size += sys.getsizeof(self._edges) + len(self._edges) * sys.getsizeof((True, True))
+        return size
+
+    def _at_word_boundaries(self, text: str, start: int, end: int, pid: int) -> bool:
+        """בדיקת גבולות המילה סביב מופע (במצבי המילים); עלות קבועה לכל מופע"""
+        head, tail = self._edges[pid]
+        if tail and _is_word_char(text, end):
+            return False
+        if head and _is_word_char(text, start - 1):
+            if self.match_mode != MATCH_PREFIXES:
+                return False
+            # דילוג על אותיות השימוש שלפני המילה - לפניהן חייב להיות גבול מילה
+            i = start - 1
+            while i >= 0 and start - i <= MAX_PREFIX_LETTERS and text[i] in HEBREW_PREFIX_LETTERS:
+                i -= 1
+            return not _is_word_char(text, i)
+        return True
+
+    def scan(self, text: str) -> tuple[list, int]:
+        """
+        מציאת ההחלפות בטקסט בסריקה אחת, ללא חפיפות: המופע השמאלי ביותר נבחר, ובין מופעים
+        שמתחילים באותו מקום - בעל העדיפות הגבוהה, ואז הארוך ביותר.
+        ההכרעה נעשית תוך כדי הסריקה: לכל מיקום התחלה נשמר רק המועמד הטוב ביותר, והוא נקבע ברגע
+        שעומק האוטומט מראה שאף מופע שעוד לא הסתיים אינו יכול להתחיל לפניו או במקומו.
+        מחזיר (רשימת (start, end, from, to) לפי מיקום, במיקומים של הטקסט המקורי;
+        מספר המופעים שנדחו בגלל חפיפה).
+        """
+        goto, fail, out, depth = self._goto, self._fail, self._out, self._depth
+        lengths, ranks = self._lengths, self._ranks
+        words = self.match_mode != MATCH_SUBSTRING
+        normalize = self.normalize
+        view, starts, ends = normalize_text(text) if normalize else (text, None, None)
+        chosen = []
+        best = {}  # מיקום התחלה → הכלל הטוב ביותר שמתחיל שם (מועמדים שעוד לא נקבעו)
+        first = len(view)  # מיקום ההתחלה של המועמד השמאלי ביותר
+        last_end = 0
+        dropped = 0
+
+        def commit(frontier: int):
+            """קביעת המועמדים שמתחילים לפני frontier, משמאל לימין, ופסילת החופפים להם"""
+            nonlocal first, last_end, dropped
+            while best:
+                start = min(best)
+                if start >= frontier:
+                    first = start
+                    return
+                pid = best.pop(start)
+                last_end = start + lengths[pid]
+                chosen.append((start, last_end, pid))
+                for other in [s for s in best if s < last_end]:
+                    del best[other]
+                    dropped += 1
+            first = len(view)
+
+        node = 0
+        for i, ch in enumerate(view):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            outputs = out[node]
+            if not outputs:
+                continue
+            end = i + 1
+            for pid in outputs:
+                start = end - lengths[pid]
+                if words and not self._at_word_boundaries(view, start, end, pid):
+                    continue
+                if normalize and (self._splits_character(starts, start, end, len(view))
+                                  or self._already_target(text, starts, ends, start, end, pid)):
+                    continue
+                if start < last_end:
+                    dropped += 1
+                    continue
+                current = best.get(start)
+                if current is None:
+                    best[start] = pid
+                    if start < first:
+                        first = start
+                else:
+                    dropped += 1
+                    if ranks[pid] > ranks[current]:
+                        best[start] = pid
+            # כל מופע עתידי מתחיל לכל המוקדם בתחילת הסיומת שהאוטומט מחזיק כרגע. הגבול הזה רק מתקדם,
+            # ולכן מספיק לבדוק אותו כשנמצא מופע (ובסוף הטקסט)
+            if first < end - depth[node]:
+                commit(end - depth[node])
+        commit(len(view) + 1)
+
+        patterns = self.patterns
+        if starts is not None:
+            return [(starts[s], ends[e - 1], *patterns[pid]) for s, e, pid in chosen], dropped
+        return [(s, e, *patterns[pid]) for s, e, pid in chosen], dropped
+
+    @staticmethod
+    def _splits_character(starts: list, start: int, end: int, length: int) -> bool:
+        """
+        במצב מנורמל: האם גבול המופע נופל בתוך תו מקורי אחד (אות וסימן צירוף שאינו ניקוד,
+        למשל é שפורקה ל-e וסימן) - מופע כזה היה מוחק את התו כולו, והוא נדחה
+        """
+        if starts is None:
+            return False
+        return (start > 0 and starts[start] == starts[start - 1]) or (end < length and starts[end] == starts[end - 1])
+
+    def _already_target(self, text: str, starts: list, ends: list, start: int, end: int, pid: int) -> bool:
+        """במצב מנורמל: האם הטקסט המקורי של המופע כבר זהה ליעד (אין מה להחליף)"""
+        if starts is not None:
+            start, end = starts[start], ends[end - 1]
+        return text[start:end] == self.patterns[pid][1]
+
+    def find_replacements(self, text: str) -> list:
+        """מציאת ההחלפות בטקסט - לפי מיקום וללא חפיפות"""
+        return self.scan(text)[0]
+
+
+class IncrementalMatcher:
+    """
+    עטיפה לאוטומט שזוכרת, לכל פסקה (לפי hash של הטקסט), את ההחלפות שנמצאו בה.
+    בעיבוד חוזר של אותו מסמך אחרי שינוי במילון, פסקה שהטקסט שלה אינו מכיל אף מקור
+    של כלל שנוסף, נמחק או שהיעד או העדיפות שלו השתנו - מקבלת את ההחלפות הקודמות בלי סריקה.
+    התוצאה זהה לסריקה מלאה: שאר הכללים מוצאים בדיוק את אותם מועמדים, ולכן גם ההכרעה זהה.
+    """
+
+    # מעל מספר זה של כללים שהשתנו, הבדיקה נעשית באוטומט במקום חיפוש מחרוזות
+    MAX_SUBSTRING_CHECKS = 64
+
+    def __init__(self, matcher: DictionaryMatcher, rules: dict, previous_rules: dict = None,
+                 previous_index: dict = None):
+        self.matcher = matcher
+        self.index = {}
+        self.reused = 0
+        self.rescanned = 0
+        self._previous = previous_index or {}
+        previous_rules = previous_rules or {}
+        changed = [f for f in rules.keys() | previous_rules.keys() if rules.get(f) != previous_rules.get(f)]
+        # באוטומט מנורמל - הבדיקה על התצוגה המנורמלת (כלל מנורמל נמצא גם בטקסט שאינו מכיל אותו כמו שהוא)
+        self._normalize = matcher.normalize
+        if self._normalize:
+            changed = [key for key in (normalize_text(f)[0] for f in changed) if key]
+        self._changed = changed
+        self._changed_matcher = None
+        if len(changed) > self.MAX_SUBSTRING_CHECKS:
+            self._changed_matcher = DictionaryMatcher([], rules=dict.fromkeys(changed, ("", 0)))
+
+    def __len__(self) -> int:
+        return len(self.matcher)
+
+    def _affected(self, text: str) -> bool:
+        """האם הטקסט מכיל מקור של כלל שהשתנה"""
+        if self._normalize:
+            text = normalize_text(text)[0]
+        if self._changed_matcher is not None:
+            return bool(self._changed_matcher.find_replacements(text))
+        return any(from_text in text for from_text in self._changed)
+
+    def scan(self, text: str) -> tuple[list, int]:
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+        previous = self._previous.get(key)
+        if previous is not None and not self._affected(text):
+            found, dropped = [tuple(replacement) for replacement in previous[0]], previous[1]
+            self.reused += 1
+        else:
+            found, dropped = self.matcher.scan(text)
+            self.rescanned += 1
+        self.index[key] = [found, dropped]
+        return found, dropped
+
+    def find_replacements(self, text: str) -> list:
+        return self.scan(text)[0]
+
+
+def dictionary_hash(dictionary: list) -> str:
+    """חישוב hash לתוכן המילון (מקור, יעד ועדיפות של כל כלל, לפי הסדר)"""
+    payload = json.dumps(
+        [[e["from"], e["to"]] + ([e["priority"]] if e.get("priority") else []) for e in dictionary],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+_matcher_cache = OrderedDict()
+_matcher_cache_bytes = 0
+_matcher_cache_lock = threading.Lock()
+
+
+def _evict(key):
+    """הוצאת רשומה מהמטמון (יש להחזיק את המנעול)"""
+    global _matcher_cache_bytes
+    matcher = _matcher_cache.pop(key)
+    _matcher_cache_bytes -= matcher.size_bytes
+
+
+def matching_options_key(match_mode: str = MATCH_SUBSTRING, normalize: bool = False) -> str:
+    """מזהה קצר לאפשרויות ההתאמה (למפתחות מטמון)"""
+    return f"{match_mode}-normalized" if normalize else match_mode
+
+
+def get_matcher(publisher: str, dictionary: list, match_mode: str = MATCH_SUBSTRING,
+                normalize: bool = False) -> DictionaryMatcher:
+    """
+    קבלת אוטומט מהודר למילון של הוצאה, מתוך מטמון LRU משותף לתהליך.
+    המפתח הוא שם ההוצאה + hash של תוכן המילון + אפשרויות ההתאמה, כך שמילון שהשתנה נבנה מחדש.
+    """
+    global _matcher_cache_bytes
+    key = (publisher, dictionary_hash(dictionary), matching_options_key(match_mode, normalize))
+    with _matcher_cache_lock:
+        matcher = _matcher_cache.get(key)
+        if matcher is not None:
+            _matcher_cache.move_to_end(key)
+            return matcher
+
+    matcher = DictionaryMatcher(dictionary, match_mode, normalize)
+
+    with _matcher_cache_lock:
+        if key in _matcher_cache:
+            _evict(key)
+        _matcher_cache[key] = matcher
+        _matcher_cache_bytes += matcher.size_bytes
+        # פינוי הרשומות הישנות ביותר עד לעמידה בתקרה (הרשומה החדשה תמיד נשמרת)
+        while _matcher_cache_bytes > MATCHER_CACHE_MAX_BYTES and len(_matcher_cache) > 1:
+            _evict(next(iter(_matcher_cache)))
+    return matcher
+
+
+def invalidate_matchers(publishers: dict):
+    """הסרת אוטומטים של הוצאות שנמחקו או שהמילון שלהן השתנה"""
+    with _matcher_cache_lock:
+        for key in list(_matcher_cache):
+            publisher, digest, _ = key
+            data = publishers.get(publisher)
+            if data is None or dictionary_hash(data.get("dictionary", [])) != digest:
+                _evict(key)
@@ -0,0 +1,739 @@
+"""
+עיבוד מסמכי Word - החלפת מילים עם סימון עקוב אחר שינויים (Track Changes)
+"""
+
+import json
+import re
+import struct
+import time
+import zipfile
+from bisect import bisect_right
+from contextlib import contextmanager
+from copy import copy, deepcopy
+from datetime import datetime
+from docx import Document
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from lxml import etree
+from matcher import DictionaryMatcher
+
+AUTHOR = "עורך ספרים"
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+XML_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
+MC_NS = 'http://schemas.openxmlformats.org/markup-compatibility/2006'
+CONTENT_TYPES_PART = "[Content_Types].xml"
+
+BODY_LABEL = "גוף המסמך"
+TEXTBOX_LABEL = "תיבת טקסט"
+
+# חלקי המסמך המכילים טקסט (story parts) לפי סוג התוכן
+_WML_CT = "application/vnd.openxmlformats-officedocument.wordprocessingml."
+STORY_PART_LABELS = {
+    _WML_CT + "document.main+xml": BODY_LABEL,
+    _WML_CT + "template.main+xml": BODY_LABEL,
+    "application/vnd.ms-word.document.macroEnabled.main+xml": BODY_LABEL,
+    "application/vnd.ms-word.template.macroEnabledTemplate.main+xml": BODY_LABEL,
+    _WML_CT + "header+xml": "כותרת עליונה",
+    _WML_CT + "footer+xml": "כותרת תחתונה",
+    _WML_CT + "footnotes+xml": "הערות שוליים",
+    _WML_CT + "endnotes+xml": "הערות סיום",
+    _WML_CT + "comments+xml": "הערות",
+}
+
+
+class ProcessingStats:
+    """
+    מונים וזמנים של עיבוד מסמך, לפי שלבים:
+    load (קריאה ופענוח), match (חיפוש), rebuild (בניית ה-runs) ו-serialize (כתיבה).
+    """
+
+    PHASES = ("load", "match", "rebuild", "serialize")
+
+    def __init__(self):
+        self.paragraphs = 0
+        self.paragraphs_changed = 0
+        self.runs_rebuilt = 0
+        self.runs_created = 0
+        self.matches = 0
+        self.overlap_dropped = 0
+        self.deepcopies = 0
+        self.timings = dict.fromkeys(self.PHASES, 0.0)
+        self.total_s = 0.0
+
+    @contextmanager
+    def phase(self, name: str):
+        """מדידת זמן של קטע קוד והוספתו לשלב"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - started
+
+    def to_dict(self) -> dict:
+        return {
+            "paragraphs": self.paragraphs,
+            "paragraphs_changed": self.paragraphs_changed,
+            "runs_rebuilt": self.runs_rebuilt,
+            "runs_created": self.runs_created,
+            "matches": self.matches,
+            "overlap_dropped": self.overlap_dropped,
+            "deepcopies": self.deepcopies,
+            "timings_s": {name: round(value, 4) for name, value in self.timings.items()},
+            "total_s": round(self.total_s, 4),
+        }
+
+    def append_to_log(self, path, **context):
+        """הוספת שורת JSON (עם פרטי הקשר, למשל שם הקובץ) לקובץ לוג"""
+        record = {"time": datetime.now().isoformat(timespec="seconds"), **context, **self.to_dict()}
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class TrackChangesEditor:
+    """
+    החלפת מילים בפסקאות עם סימון Track Changes.
+    האוטומט, מונה מזהי השינויים (w:id) ולוג השינויים משותפים לכל הפסקאות במסמך.
+    """
+
+    def __init__(self, matcher: DictionaryMatcher, author: str = AUTHOR, stats: ProcessingStats = None,
+                 minimal_edits: bool = False):
+        self.matcher = matcher
+        self.author = author
+        # עריכה מינימלית: פיצול רק של ה-runs שבהם יש התאמה, כל השאר נשאר במקומו
+        self.minimal_edits = minimal_edits
+        self.date_str = datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
+        self.rev_id = 1
+        self.changes = []
+        self.stats = stats if stats is not None else ProcessingStats()
+        # עיצובי runs מקוריים שכבר הועברו ל-run חדש בפסקה הנוכחית
+        self._placed_rprs = set()
+
+    def make_run(self, text, rpr=None, is_del_text=False):
+        """
+        יצירת אלמנט run חדש עם טקסט ועיצוב.
+        העיצוב המקורי (rPr) מועבר כמו שהוא ל-run הראשון שמשתמש בו, ומועתק רק לבאים אחריו.
+        """
+        r = OxmlElement('w:r')
+        self.stats.runs_created += 1
+        if rpr is not None:
+            if id(rpr) in self._placed_rprs:
+                self.stats.deepcopies += 1
+                rpr = deepcopy(rpr)
+            else:
+                self._placed_rprs.add(id(rpr))
+            r.append(rpr)
+        tag = 'w:delText' if is_del_text else 'w:t'
+        t = OxmlElement(tag)
+        t.set(XML_SPACE, 'preserve')
+        t.text = text
+        r.append(t)
+        return r
+
+    def process_paragraph(self, p_elem, para_idx: int, part: str = BODY_LABEL, record: bool = True):
+        """
+        החלפת מילים בפסקה בודדת (אלמנט w:p) - הפסקה נערכת במקום.
+        part - שם החלק במסמך ללוג; record=False מעבד בלי לרשום ללוג (עותק חלופי של תיבת טקסט).
+        """
+
+        stats = self.stats
+        stats.paragraphs += 1
+        started = time.perf_counter()
+
+        # איסוף כל ה-runs מהפסקה
+        run_elements = [child for child in p_elem if child.tag == f'{{{W_NS}}}r']
+        if not run_elements:
+            stats.timings["match"] += time.perf_counter() - started
+            return
+
+        # מסלול מהיר: קודם רק הטקסט של הפסקה והחיפוש בו - רוב הפסקאות אינן משתנות,
+        # ולהן לא נבנית מפת runs ולא מועתק עיצוב
+        run_texts = [''.join((t.text or '') for t in rel.iterchildren(f'{{{W_NS}}}t')) for rel in run_elements]
+        full_text = ''.join(run_texts)
+        if not full_text:
+            stats.timings["match"] += time.perf_counter() - started
+            return
+
+        # מציאת כל ההחלפות בטקסט המקורי - סריקה אחת לכל הכללים, החפיפות מוכרעות תוך כדי
+        replacements, dropped = self.matcher.scan(full_text)
+        matched = time.perf_counter()
+        stats.timings["match"] += matched - started
+        stats.overlap_dropped += dropped
+        if not replacements:
+            return
+        stats.matches += len(replacements)
+        stats.paragraphs_changed += 1
+
+        # רישום שינויים ללוג
+        for _, _, from_text, to_text in replacements if record else ():
+            self.changes.append({
+                "חלק": part,
+                "שורה": para_idx,
+                "מקור": from_text,
+                "הוחלף ל": to_text
+            })
+
+        # עיצובי runs שכבר הועברו - לכל פסקה מחדש, בשני המסלולים
+        self._placed_rprs = set()
+        if self.minimal_edits:
+            self.edit_runs_in_place(run_elements, run_texts, replacements)
+            stats.timings["rebuild"] += time.perf_counter() - matched
+            return
+
+        # בניית מפת מיקומים: לכל run שומרים טקסט, עיצוב ומיקום בטקסט המלא
+        runs_data = []
+        pos = 0
+        for rel, run_text in zip(run_elements, run_texts):
+            runs_data.append({
+                'element': rel,
+                'text': run_text,
+                'start': pos,
+                'end': pos + len(run_text),
+                'rPr': rel.find(f'{{{W_NS}}}rPr')
+            })
+            pos += len(run_text)
+        stats.runs_rebuilt += len(runs_data)
+
+        # בניית רשימת מקטעים: keep (ללא שינוי) או replace (החלפה)
+        segments = []
+        cur = 0
+        for start, end, from_text, to_text in replacements:
+            if cur < start:
+                segments.append(('keep', cur, start))
+            segments.append(('replace', start, end, from_text, to_text))
+            cur = end
+        if cur < len(full_text):
+            segments.append(('keep', cur, len(full_text)))
+
+        run_starts = [rd['start'] for rd in runs_data]
+
+        def get_portions(char_start, char_end):
+            """קבלת חלקי runs (עיצוב + טקסט) עבור טווח תווים - חיפוש בינארי של ה-run הראשון"""
+            portions = []
+            i = bisect_right(run_starts, char_start) - 1
+            while i < len(runs_data) and run_starts[i] < char_end:
+                rd = runs_data[i]
+                o_start = max(char_start, rd['start'])
+                o_end = min(char_end, rd['end'])
+                if o_start < o_end:
+                    txt = rd['text'][o_start - rd['start']:o_end - rd['start']]
+                    portions.append((rd['rPr'], txt))
+                i += 1
+            return portions
+
+        # מציאת נקודת הכנסה - שומר על אלמנטים לפני ה-runs (כמו pPr)
+        ref_element = None
+        for child in p_elem:
+            if child.tag == f'{{{W_NS}}}r':
+                break
+            ref_element = child
+
+        # הסרת כל ה-runs הישנים מהפסקה
+        for rd in runs_data:
+            p_elem.remove(rd['element'])
+
+        # האלמנטים החדשים נאספים לרשימה ומוכנסים לפסקה בפעולה אחת בסוף
+        new_elements = []
+
+        # runs ללא טקסט (ציור, תיבת טקסט, טאב, שדה...) מוחזרים כמו שהם, במיקומם בטקסט
+        textless = [rd['element'] for rd in runs_data if not rd['text']]
+        textless_pos = [rd['start'] for rd in runs_data if not rd['text']]
+        next_textless = 0
+
+        def restore_textless(before):
+            """החזרת ה-runs ללא טקסט שמיקומם קודם לתו before"""
+            nonlocal next_textless
+            while next_textless < len(textless) and textless_pos[next_textless] < before:
+                new_elements.append(textless[next_textless])
+                next_textless += 1
+
+        # בניית אלמנטים חדשים לפי המקטעים
+        for segment in segments:
+            if segment[0] == 'keep':
+                _, seg_start, seg_end = segment
+                portion_start = seg_start
+                for rpr, text in get_portions(seg_start, seg_end):
+                    restore_textless(portion_start + 1)
+                    new_elements.append(self.make_run(text, rpr))
+                    portion_start += len(text)
+                restore_textless(seg_end)
+
+            elif segment[0] == 'replace':
+                _, seg_start, seg_end, from_text, to_text = segment
+                restore_textless(seg_start + 1)
+
+                # אלמנט מחיקה <w:del> - הטקסט המקורי עם העיצוב המקורי
+                del_el = self._new_revision('w:del')
+                del_portions = get_portions(seg_start, seg_end)
+                for rpr, text in del_portions:
+                    del_el.append(self.make_run(text, rpr, is_del_text=True))
+                new_elements.append(del_el)
+
+                # אלמנט הוספה <w:ins> - הטקסט החדש עם עיצוב מה-run הראשון
+                ins_el = self._new_revision('w:ins')
+                first_rpr = del_portions[0][0] if del_portions else None
+                ins_el.append(self.make_run(to_text, first_rpr))
+                new_elements.append(ins_el)
+                restore_textless(seg_end)
+
+        restore_textless(len(full_text) + 1)
+
+        # הכנסה מיד אחרי נקודת ההכנסה: שרשרת addnext (כל הכנסה ב-O(1), בלי חישוב אינדקס)
+        if ref_element is None:
+            p_elem[0:0] = new_elements
+        else:
+            anchor = ref_element
+            for el in new_elements:
+                anchor.addnext(el)
+                anchor = el
+        stats.timings["rebuild"] += time.perf_counter() - matched
+
+    def _new_revision(self, tag: str):
+        """אלמנט סימון שינוי (w:del / w:ins) עם מזהה, מחבר ותאריך"""
+        el = OxmlElement(tag)
+        el.set(qn('w:id'), str(self.rev_id))
+        el.set(qn('w:author'), self.author)
+        el.set(qn('w:date'), self.date_str)
+        self.rev_id += 1
+        return el
+
+    def split_run(self, run, pieces: list) -> list:
+        """
+        פיצול run במקומו לפי חלקי הטקסט שלו [(start, end, j), ...], כש-j הוא מספר ההתאמה
+        או None לטקסט שנשאר. אלמנטים שאינם טקסט (טאב, שבירה...) שייכים להתאמה רק אם הם
+        בתוכה, אחרת הם נשארים. ה-run המקורי נשאר כחלק הראשון (עם המאפיינים והעיצוב שלו);
+        לכל חלק נוסף נוצר run עם אותם מאפיינים ועותק של העיצוב.
+        מחזיר רשימת (run, j) לפי הסדר.
+        """
+        rpr_tag, t_tag = f'{{{W_NS}}}rPr', f'{{{W_NS}}}t'
+        groups = []  # [j, ילדים]
+
+        def place(j, child):
+            if not groups or groups[-1][0] != j:
+                groups.append([j, []])
+            groups[-1][1].append(child)
+
+        idx = 0
+        offset = 0
+        for child in run:
+            if child.tag == rpr_tag:
+                continue
+            text = (child.text or '') if child.tag == t_tag else ''
+            if not text:
+                while idx + 1 < len(pieces) and pieces[idx][1] <= offset:
+                    idx += 1
+                start, end, j = pieces[idx]
+                place(j if start < offset < end else None, child)
+                continue
+            text_start = offset
+            text_end = offset + len(text)
+            first = True
+            while offset < text_end:
+                while pieces[idx][1] <= offset:
+                    idx += 1
+                cut = min(text_end, pieces[idx][1])
+                if first:
+                    t = child
+                    first = False
+                else:
+                    t = OxmlElement('w:t')
+                    t.set(XML_SPACE, 'preserve')
+                if cut - offset != len(text):
+                    t.set(XML_SPACE, 'preserve')
+                    t.text = text[offset - text_start:cut - text_start]
+                place(pieces[idx][2], t)
+                offset = cut
+
+        if len(groups) == 1:
+            return [(run, groups[0][0])]
+
+        rpr = run.find(rpr_tag)
+        for child in list(run):
+            if child is not rpr:
+                run.remove(child)
+        run.extend(groups[0][1])
+        result = [(run, groups[0][0])]
+        previous = run
+        for j, content in groups[1:]:
+            new_run = OxmlElement('w:r', attrs=dict(run.attrib))
+            if rpr is not None:
+                self.stats.deepcopies += 1
+                new_run.append(deepcopy(rpr))
+            new_run.extend(content)
+            previous.addnext(new_run)
+            previous = new_run
+            result.append((new_run, j))
+            self.stats.runs_created += 1
+        return result
+
+    def edit_runs_in_place(self, run_elements: list, run_texts: list, replacements: list):
+        """
+        עריכה מינימלית של פסקה: רק ה-runs שחופפים להתאמה מפוצלים בגבולות ההתאמה,
+        וחלקי ההתאמה נעטפים ב-w:del (כל רצף צמוד בסימון אחד) ואחריהם w:ins.
+        שאר ה-runs וכל שאר הילדים של הפסקה (סימניות, שדות, עוגני הערות) לא נוגעים.
+        """
+        matched_runs = [[] for _ in replacements]
+        m = 0
+        run_start = 0
+        for run, text in zip(run_elements, run_texts):
+            run_end = run_start + len(text)
+            while m < len(replacements) and replacements[m][1] <= run_start:
+                m += 1
+            # חלקי ה-run: (תחילה, סוף, אינדקס ההתאמה או None לחלק שנשאר)
+            pieces = []
+            local = 0
+            j = m
+            while j < len(replacements) and replacements[j][0] < run_end:
+                start = max(replacements[j][0], run_start) - run_start
+                end = min(replacements[j][1], run_end) - run_start
+                if local < start:
+                    pieces.append((local, start, None))
+                pieces.append((start, end, j))
+                local = end
+                j += 1
+            run_start = run_end
+            if not pieces:
+                continue
+            if local < len(text):
+                pieces.append((local, len(text), None))
+            self.stats.runs_rebuilt += 1
+            for piece_run, j in self.split_run(run, pieces):
+                if j is not None:
+                    matched_runs[j].append(piece_run)
+
+        del_tag = f'{{{W_NS}}}delText'
+        for (_, _, _, to_text), runs in zip(replacements, matched_runs):
+            del_el = None
+            for run in runs:
+                for t in run.iterchildren(f'{{{W_NS}}}t'):
+                    t.tag = del_tag
+                if del_el is None or run.getprevious() is not del_el:
+                    del_el = self._new_revision('w:del')
+                    run.addprevious(del_el)
+                del_el.append(run)
+            # ההוספה - עם עיצוב החלק הראשון של ההתאמה; העיצוב נשאר ב-run המחוק, ולכן make_run מעתיק אותו
+            first_rpr = runs[0].find(f'{{{W_NS}}}rPr')
+            if first_rpr is not None:
+                self._placed_rprs.add(id(first_rpr))
+            ins_el = self._new_revision('w:ins')
+            ins_el.append(self.make_run(to_text, first_rpr))
+            del_el.addnext(ins_el)
+
+
+def process_document(doc: Document, dictionary: list, matcher: DictionaryMatcher = None,
+                     stats: ProcessingStats = None, minimal_edits: bool = False) -> tuple[Document, list]:
+    """
+    עיבוד מסמך Word והחלפת מילים עם סימון עקוב אחר שינויים (Track Changes).
+    stats - אובייקט ProcessingStats למילוי (טעינת המסמך ושמירתו נמדדות ע"י הקורא, עם stats.phase).
+    minimal_edits - פיצול רק של ה-runs שבהם יש התאמה, במקום בנייה מחדש של כל הפסקה.
+    """
+    started = time.perf_counter()
+    if matcher is None:
+        matcher = DictionaryMatcher(dictionary)
+    editor = TrackChangesEditor(matcher, stats=stats, minimal_edits=minimal_edits)
+    stats = editor.stats
+
+    # עיבוד כל הפסקאות בגוף המסמך, כולל טבלאות (ומקוננות) ותיבות טקסט - ישירות מעץ ה-XML,
+    # כך שכל פסקה מעובדת פעם אחת בדיוק, גם בתאים ממוזגים
+    process_story_element(doc.element.body, editor, BODY_LABEL)
+
+    # עיבוד שאר חלקי הטקסט: כותרות, הערות שוליים וסיום, הערות
+    for part in doc.part.package.iter_parts():
+        label = STORY_PART_LABELS.get(part.content_type)
+        if label is None or part is doc.part:
+            continue
+        label = f"{label} ({part.partname.filename})"
+        root = getattr(part, "_element", None)
+        if root is not None:
+            process_story_element(root, editor, label)
+        else:
+            # חלק שאינו נטען כ-XML ע"י python-docx (למשל הערות שוליים) - עיבוד ה-blob
+            with stats.phase("load"):
+                root = etree.fromstring(part.blob)
+            process_story_element(root, editor, label)
+            with stats.phase("serialize"):
+                part._blob = etree.tostring(root, encoding='UTF-8', xml_declaration=True, standalone=True)
+
+    stats.total_s += time.perf_counter() - started
+    return doc, editor.changes
+
+
+# ===== מנוע זורם: עיבוד חבילת ה-docx ישירות, בלי לטעון את כל המסמך =====
+
+# אלמנטים שנפתחים בפלט ואינם נשמרים בזיכרון - ילדיהם נכתבים אחד אחד
+STREAM_CONTAINERS = {
+    f'{{{W_NS}}}document', f'{{{W_NS}}}body', f'{{{W_NS}}}hdr', f'{{{W_NS}}}ftr',
+    f'{{{W_NS}}}footnotes', f'{{{W_NS}}}endnotes', f'{{{W_NS}}}comments',
+}
+
+_XMLNS_ATTR = re.compile(rb'\sxmlns(?::([\w.\-]+))?="([^"]*)"')
+
+
+def _strip_inherited_xmlns(data: bytes, inherited: dict) -> bytes:
+    """הסרת הצהרות namespace מהתג הפותח שכבר הוצהרו (זהות) ברמה עליונה"""
+    tag_end = data.index(b'>')
+
+    def keep(m):
+        prefix = m.group(1).decode() if m.group(1) else None
+        return b'' if inherited.get(prefix) == m.group(2).decode() else m.group(0)
+
+    return _XMLNS_ATTR.sub(keep, data[:tag_end]) + data[tag_end:]
+
+
+def _open_tag(elem, inherited: dict) -> tuple[bytes, bytes]:
+    """תג פותח ותג סוגר עבור אלמנט מכיל (בלי ילדיו)"""
+    shallow = etree.Element(elem.tag, dict(elem.attrib), nsmap=elem.nsmap)
+    data = _strip_inherited_xmlns(etree.tostring(shallow, encoding='UTF-8', xml_declaration=False), inherited)
+    name = f'{elem.prefix}:{etree.QName(elem).localname}' if elem.prefix else etree.QName(elem).localname
+    return data[:-2].rstrip() + b'>', f'</{name}>'.encode('utf-8')
+
+
+def process_story_element(elem, editor: TrackChangesEditor, part: str, para_idx: int = 0) -> int:
+    """
+    עיבוד כל הפסקאות בתוך אלמנט: פסקאות ישירות, טבלאות (כולל מקוננות), הערות שוליים
+    ותיבות טקסט (w:txbxContent). מחזיר את מספר הפסקה האחרון בחלק.
+    editor - TrackChangesEditor, או ImpactPreview לסריקה בלבד.
+    """
+    # בדיקת אבות רק כשיש תיבות טקסט באלמנט (סריקה אחת ב-C)
+    has_textboxes = next(elem.iter(f'{{{W_NS}}}txbxContent'), None) is not None
+    for p_elem in list(elem.iter(f'{{{W_NS}}}p')):
+        para_idx += 1
+        label, record = part, True
+        if has_textboxes and next(p_elem.iterancestors(f'{{{W_NS}}}txbxContent'), None) is not None:
+            label = f"{part} - {TEXTBOX_LABEL}"
+            # תיבת טקסט מופיעה גם בעותק חלופי (mc:Fallback) - מעובדת, אך לא נרשמת פעמיים
+            record = next(p_elem.iterancestors(f'{{{MC_NS}}}Fallback'), None) is None
+        editor.process_paragraph(p_elem, para_idx, label, record)
+    return para_idx
+
+
+def rewrite_story_xml(source, destination, editor: TrackChangesEditor, part: str = BODY_LABEL):
+    """
+    קריאת XML של חלק במסמך באופן הדרגתי (iterparse), עיבוד כל אלמנט ברמה העליונה
+    (פסקה, טבלה, הערת שוליים...) ברגע שנקרא במלואו, כתיבתו לפלט ושחרורו מהזיכרון.
+    """
+    destination.write(b"<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n")
+    open_stack = []
+    inherited = {}
+    para_idx = 0
+    for event, elem in etree.iterparse(source, events=('start', 'end'), huge_tree=True):
+        if event == 'start':
+            if elem.tag in STREAM_CONTAINERS and (not open_stack or elem.getparent() is open_stack[-1][0]):
+                start_tag, end_tag = _open_tag(elem, inherited)
+                destination.write(start_tag)
+                open_stack.append((elem, end_tag))
+                inherited = dict(elem.nsmap)
+            continue
+
+        if open_stack and elem is open_stack[-1][0]:
+            destination.write(open_stack.pop()[1])
+        elif open_stack and elem.getparent() is open_stack[-1][0]:
+            para_idx = process_story_element(elem, editor, part, para_idx)
+            started = time.perf_counter()
+            data = etree.tostring(elem, encoding='UTF-8', xml_declaration=False)
+            destination.write(_strip_inherited_xmlns(data, inherited))
+            elem.getparent().remove(elem)
+            editor.stats.timings["serialize"] += time.perf_counter() - started
+
+
+def read_story_parts(zin: zipfile.ZipFile) -> dict:
+    """מיפוי שם קובץ בחבילה → תווית החלק, לפי [Content_Types].xml"""
+    root = etree.fromstring(zin.read(CONTENT_TYPES_PART))
+    parts = {}
+    for override in root:
+        label = STORY_PART_LABELS.get(override.get("ContentType"))
+        if label is None:
+            continue
+        name = override.get("PartName", "").lstrip("/")
+        if label != BODY_LABEL:
+            label = f"{label} ({name.rsplit('/', 1)[-1]})"
+        parts[name] = label
+    return parts
+
+
+_PARAGRAPH_TAG = re.compile(rb'<w:p[\s>/]')
+
+
+def count_paragraphs(source) -> int:
+    """
+    ספירה מהירה (משוערת) של הפסקאות בכל חלקי הטקסט, לצורך דיווח התקדמות:
+    סריקת הבתים של ה-XML בלי לפענח אותו.
+    """
+    total = 0
+    with zipfile.ZipFile(source) as zin:
+        for name in read_story_parts(zin):
+            if name not in zin.NameToInfo:
+                continue
+            with zin.open(name) as f:
+                carry = b''
+                while chunk := f.read(1 << 20):
+                    data = carry + chunk
+                    total += len(_PARAGRAPH_TAG.findall(data))
+                    # תג שנחתך בין שני קטעים - נספר בקטע הבא
+                    cut = data.rfind(b'<', max(0, len(data) - 4))
+                    carry = data[cut:] if cut != -1 and not _PARAGRAPH_TAG.match(data, cut) else b''
+    return total
+
+
+def _copy_member_raw(zin: zipfile.ZipFile, zout: zipfile.ZipFile, info: zipfile.ZipInfo):
+    """העתקת חלק מהחבילה כמו שהוא, בית-אחר-בית, בלי לפרוס ולדחוס מחדש"""
+    zin.fp.seek(info.header_offset)
+    local_header = zin.fp.read(30)
+    name_len, extra_len = struct.unpack('<HH', local_header[26:30])
+    zin.fp.seek(name_len + extra_len, 1)
+
+    out_info = copy(info)
+    out_info.flag_bits &= ~0x08  # הגדלים ידועים מראש - אין צורך ב-data descriptor
+    out_info.header_offset = zout.fp.tell()
+    zout.fp.write(out_info.FileHeader())
+
+    remaining = info.compress_size
+    while remaining:
+        chunk = zin.fp.read(min(remaining, 1 << 20))
+        if not chunk:
+            raise zipfile.BadZipFile(f"קובץ קטוע: {info.filename}")
+        zout.fp.write(chunk)
+        remaining -= len(chunk)
+
+    zout.filelist.append(out_info)
+    zout.NameToInfo[out_info.filename] = out_info
+    zout.start_dir = zout.fp.tell()
+
+
+def process_docx_stream(source, destination, dictionary: list, matcher: DictionaryMatcher = None,
+                        stats: ProcessingStats = None, minimal_edits: bool = False) -> list:
+    """
+    עיבוד קובץ docx בזרימה: כל חלקי הטקסט (גוף, כותרות, הערות שוליים וסיום, הערות)
+    נקראים ונכתבים אלמנט אחר אלמנט לקובץ zip חדש, וכל שאר חלקי החבילה
+    (תמונות, סגנונות...) מועתקים כמו שהם.
+    source / destination - נתיב או אובייקט קובץ (destination חייב לתמוך ב-seek).
+    stats - אובייקט ProcessingStats למילוי (אופציונלי).
+    minimal_edits - פיצול רק של ה-runs שבהם יש התאמה, במקום בנייה מחדש של כל הפסקה.
+    מחזיר את לוג השינויים.
+    """
+    started = time.perf_counter()
+    if matcher is None:
+        matcher = DictionaryMatcher(dictionary)
+    editor = TrackChangesEditor(matcher, stats=stats, minimal_edits=minimal_edits)
+    stats = editor.stats
+    timings = stats.timings
+    measured = sum(timings.values())
+
+    with zipfile.ZipFile(source) as zin, zipfile.ZipFile(destination, "w") as zout:
+        story_parts = read_story_parts(zin)
+        for info in zin.infolist():
+            part = story_parts.get(info.filename)
+            if part is None:
+                with stats.phase("serialize"):
+                    _copy_member_raw(zin, zout, info)
+                continue
+            out_info = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+            out_info.compress_type = zipfile.ZIP_DEFLATED
+            # מסמך ענק: מקום לפלט גדול מהמקור (סימוני השינויים)
+            force_zip64 = info.file_size * 2 > zipfile.ZIP64_LIMIT
+            with zin.open(info) as src, zout.open(out_info, "w", force_zip64=force_zip64) as dst:
+                rewrite_story_xml(src, dst, editor, part)
+
+    # קריאה ופענוח משולבים בזרימה - כל הזמן שלא נמדד בשלב אחר
+    elapsed = time.perf_counter() - started
+    timings["load"] += max(0.0, elapsed - (sum(timings.values()) - measured))
+    stats.total_s += elapsed
+    return editor.changes
+
+
+# ===== תצוגה מקדימה: כמה החלפות כל כלל היה מבצע, בלי לשנות את המסמך =====
+
+PREVIEW_SAMPLES = 3
+PREVIEW_CONTEXT = 30
+
+
+class ImpactPreview:
+    """
+    סריקה בלבד: לכל כלל - מספר ההחלפות שהיה מבצע ודוגמאות בהקשר.
+    נקרא במקום TrackChangesEditor; הטקסט נקרא מה-XML ואף אלמנט אינו נוצר או משתנה.
+    """
+
+    def __init__(self, matcher: DictionaryMatcher, stats: ProcessingStats = None,
+                 max_samples: int = PREVIEW_SAMPLES, context: int = PREVIEW_CONTEXT):
+        self.matcher = matcher
+        self.stats = stats if stats is not None else ProcessingStats()
+        self.max_samples = max_samples
+        self.context = context
+        # (מקור, יעד) → [מספר מופעים, דוגמאות]
+        self.hits = {}
+
+    def process_paragraph(self, p_elem, para_idx: int, part: str = BODY_LABEL, record: bool = True):
+        """ספירת ההחלפות בפסקה; העותק החלופי של תיבת טקסט (record=False) אינו נספר"""
+        stats = self.stats
+        stats.paragraphs += 1
+        if not record:
+            return
+        started = time.perf_counter()
+        full_text = ''.join((t.text or '') for rel in p_elem.iterchildren(f'{{{W_NS}}}r')
+                            for t in rel.iterchildren(f'{{{W_NS}}}t'))
+        replacements, dropped = self.matcher.scan(full_text) if full_text else ((), 0)
+        stats.overlap_dropped += dropped
+        if replacements:
+            stats.matches += len(replacements)
+            stats.paragraphs_changed += 1
+            for start, end, from_text, to_text in replacements:
+                entry = self.hits.get((from_text, to_text))
+                if entry is None:
+                    entry = self.hits[(from_text, to_text)] = [0, []]
+                entry[0] += 1
+                if len(entry[1]) < self.max_samples:
+                    entry[1].append(self._sample(full_text, start, end))
+        stats.timings["match"] += time.perf_counter() - started
+
+    def _sample(self, text: str, start: int, end: int) -> str:
+        """ההתאמה בתוך «» עם מעט טקסט מכל צד"""
+        before = max(0, start - self.context)
+        after = min(len(text), end + self.context)
+        return (f"{'…' if before else ''}{text[before:start]}«{text[start:end]}»"
+                f"{text[end:after]}{'…' if after < len(text) else ''}")
+
+    def results(self) -> list:
+        """הכללים שנמצאו, מהנפוץ ביותר: מקור, יעד, מספר מופעים ודוגמאות"""
+        ordered = sorted(self.hits.items(), key=lambda item: (-item[1][0], item[0]))
+        return [{"מקור": from_text, "הוחלף ל": to_text, "מופעים": count, "דוגמאות": samples}
+                for (from_text, to_text), (count, samples) in ordered]
+
+
+def scan_story_xml(source, preview: ImpactPreview, part: str = BODY_LABEL):
+    """
+    קריאת XML של חלק במסמך באופן הדרגתי (iterparse), כמו rewrite_story_xml אך ללא פלט:
+    כל אלמנט ברמה העליונה נסרק ברגע שנקרא במלואו ומשוחרר מהזיכרון.
+    """
+    para_idx = 0
+    for _, elem in etree.iterparse(source, events=('end',), huge_tree=True):
+        parent = elem.getparent()
+        if parent is None or parent.tag not in STREAM_CONTAINERS or elem.tag in STREAM_CONTAINERS:
+            continue
+        para_idx = process_story_element(elem, preview, part, para_idx)
+        parent.remove(elem)
+
+
+def preview_docx_stream(source, dictionary: list, matcher: DictionaryMatcher = None,
+                        stats: ProcessingStats = None, max_samples: int = PREVIEW_SAMPLES) -> list:
+    """
+    תצוגה מקדימה של עיבוד קובץ docx: סריקת כל חלקי הטקסט בלי לבנות runs ובלי לכתוב פלט.
+    מחזיר לכל כלל שנמצא את מספר ההחלפות שהיה מבצע ועד max_samples דוגמאות בהקשר
+    (ראו ImpactPreview.results).
+    """
+    started = time.perf_counter()
+    if matcher is None:
+        matcher = DictionaryMatcher(dictionary)
+    preview = ImpactPreview(matcher, stats, max_samples)
+    stats = preview.stats
+    measured = sum(stats.timings.values())
+
+    with zipfile.ZipFile(source) as zin:
+        for name, part in read_story_parts(zin).items():
+            if name not in zin.NameToInfo:
+                continue
+            with zin.open(name) as src:
+                scan_story_xml(src, preview, part)
+
+    elapsed = time.perf_counter() - started
+    stats.timings["load"] += max(0.0, elapsed - (sum(stats.timings.values()) - measured))
+    stats.total_s += elapsed
+    return preview.results()
@@ -0,0 +1,144 @@
+"""
+מטמון תוצאות על הדיסק: קובץ מעובד ולוג שינויים לפי hash של המסמך + hash של המילון
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from matcher import MATCH_SUBSTRING, dictionary_hash, matching_options_key
+from storage import DATA_DIR
+
+RESULT_CACHE_DIR = DATA_DIR / "result_cache"
+RESULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# יש לקדם כשהפלט של מנוע העיבוד משתנה, כדי שתוצאות ישנות לא ישמשו
+RESULT_CACHE_VERSION = 3
+
+_evict_lock = threading.Lock()
+
+
+def document_hash(data: bytes) -> str:
+    """hash של תוכן המסמך שהועלה"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def result_key(document_digest: str, dictionary: list, minimal_edits: bool = True,
+               match_mode: str = MATCH_SUBSTRING, normalize: bool = False) -> str:
+    """מפתח התוצאה: תוכן המסמך, תוכן המילון ואפשרויות העיבוד"""
+    payload = (f"v{RESULT_CACHE_VERSION}:{int(minimal_edits)}:{matching_options_key(match_mode, normalize)}:"
+               f"{dictionary_hash(dictionary)}:{document_digest}")
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _paths(key: str) -> tuple[Path, Path]:
+    return RESULT_CACHE_DIR / f"{key}.docx", RESULT_CACHE_DIR / f"{key}.json"
+
+
+def _rules_hash(rules: dict) -> str:
+    return hashlib.sha256(json.dumps(sorted(rules.items()), ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _index_path(document_digest: str, options_key: str) -> Path:
+    return RESULT_CACHE_DIR / f"{document_digest}.{options_key}.index.json"
+
+
+def load_paragraph_index(document_digest: str, options_key: str = MATCH_SUBSTRING):
+    """
+    אינדקס הפסקאות מהעיבוד הקודם של המסמך עם אותן אפשרויות התאמה (matching_options_key):
+    (הכללים שבהם עובד, hash טקסט → [החלפות, נדחו]), או None אם המסמך לא עובד או שהאינדקס פונה מהמטמון.
+    """
+    index_path = _index_path(document_digest, options_key)
+    try:
+        with open(index_path, encoding="utf-8") as f:
+            index = json.load(f)
+        rules_path = RESULT_CACHE_DIR / f"{index['rules']}.rules.json"
+        if index.get("version") != RESULT_CACHE_VERSION:
+            return None
+        with open(rules_path, encoding="utf-8") as f:
+            rules = {from_text: tuple(target) for from_text, target in json.load(f).items()}
+        os.utime(index_path)
+        os.utime(rules_path)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return rules, index["paragraphs"]
+
+
+def store_paragraph_index(document_digest: str, rules: dict, paragraphs: dict, options_key: str = MATCH_SUBSTRING):
+    """שמירת אינדקס הפסקאות של המסמך; הכללים נשמרים פעם אחת לכל גרסת מילון"""
+    RESULT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    rules_digest = _rules_hash(rules)
+    rules_path = RESULT_CACHE_DIR / f"{rules_digest}.rules.json"
+    if not rules_path.exists():
+        _write_atomic(rules_path, json.dumps(rules, ensure_ascii=False).encode("utf-8"))
+    payload = {"version": RESULT_CACHE_VERSION, "rules": rules_digest, "paragraphs": paragraphs}
+    _write_atomic(_index_path(document_digest, options_key),
+                  json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+    evict_results()
+
+
+def load_result(key: str):
+    """תוצאה שמורה (פלט, לוג שינויים), או None אם אינה במטמון"""
+    docx_path, log_path = _paths(key)
+    try:
+        with open(log_path, encoding="utf-8") as f:
+            changes = json.load(f)
+        output = docx_path.read_bytes()
+        # סימון שימוש אחרון - הפינוי לפי זמן השינוי
+        os.utime(docx_path)
+        os.utime(log_path)
+    except (OSError, ValueError):
+        return None
+    return output, changes
+
+
+def _write_atomic(path: Path, data: bytes):
+    """כתיבה לקובץ זמני והחלפה, כך שקורא במקביל לא יראה קובץ חלקי"""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def store_result(key: str, output: bytes, changes: list):
+    """שמירת תוצאה במטמון ופינוי התוצאות הישנות ביותר מעבר לתקרה"""
+    RESULT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    docx_path, log_path = _paths(key)
+    # הפלט נכתב ראשון: תוצאה נחשבת שמורה רק כשקובץ הלוג קיים
+    _write_atomic(docx_path, output)
+    _write_atomic(log_path, json.dumps(changes, ensure_ascii=False).encode("utf-8"))
+    evict_results()
+
+
+def evict_results(max_bytes: int = RESULT_CACHE_MAX_BYTES):
+    """
+    מחיקת הרשומות שלא נעשה בהן שימוש הכי הרבה זמן, עד שהמטמון קטן מהתקרה.
+    רשומה היא כל הקבצים עם אותו שם בסיס (פלט ולוג, אינדקס פסקאות, כללי מילון).
+    """
+    with _evict_lock:
+        entries = {}
+        for path in RESULT_CACHE_DIR.iterdir():
+            if path.suffix == ".tmp":
+                continue
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            paths, size, used = entries.get(path.name.split(".")[0], ([], 0, 0))
+            entries[path.name.split(".")[0]] = (paths + [path], size + st.st_size, max(used, st.st_mtime))
+        total = sum(size for _, size, _ in entries.values())
+        for paths, size, _ in sorted(entries.values(), key=lambda entry: entry[2]):
+            if total <= max_bytes:
+                break
+            for path in paths:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+            total -= size
@@ -0,0 +1,150 @@
+"""
+קבצי כללים של מילון: "מילה למציאה" "מילה להחלפה" בכל שורה
+
+כלל תבנית מחליף משפחה שלמה של כללים בשורה אחת:
+"{אחת|שתים|שתיים=שתים|שלוש} עשרה" "{}־עשרה"
+קבוצה בסוגריים מסולסלים היא רשימת חלופות (מופרדות ב-|); "שתיים=שתים" - החלופה "שתיים"
+נכתבת ביעד כ"שתים". כל {} ביעד מוחלף בחלופה שנמצאה, לפי סדר הקבוצות.
+
+מספר אחרי היעד הוא עדיפות הכלל (ברירת מחדל 0): בין כללים שנמצאו באותו מקום בטקסט,
+בעל העדיפות הגבוהה מוחלף, ובעדיפות שווה - הארוך.
+"אי אפשר" "אי־אפשר" 1
+"""
+
+import re
+from itertools import product
+
+# קבוצת חלופות בתבנית: לפחות שתי חלופות בין סוגריים מסולסלים
+TEMPLATE_GROUP = re.compile(r"\{([^{}]*\|[^{}]*)\}")
+TEMPLATE_PLACEHOLDER = "{}"
+
+# מספר הצורות המרבי שכלל תבנית אחד יכול לייצר
+MAX_TEMPLATE_FORMS = 1000
+
+RULE_LINE = re.compile(r'"([^"]+)"\s+"([^"]+)"(?:\s+(-?\d+))?')
+
+
+def format_rule_line(entry: dict) -> str:
+    """שורת קובץ מילון לכלל (העדיפות נכתבת רק אם נקבעה)"""
+    line = f'"{entry["from"]}" "{entry["to"]}"'
+    if entry.get("priority"):
+        line += f' {entry["priority"]}'
+    return line
+
+
+def is_template(from_text: str) -> bool:
+    """האם המקור הוא תבנית (יש בו קבוצת חלופות)"""
+    return TEMPLATE_GROUP.search(from_text) is not None
+
+
+def _template_groups(from_text: str) -> list:
+    """החלופות של כל קבוצה בתבנית: רשימה של [(טקסט למציאה, טקסט ליעד), ...]"""
+    groups = []
+    for match in TEMPLATE_GROUP.finditer(from_text):
+        alternatives = []
+        for alternative in match.group(1).split("|"):
+            found, _, written = alternative.partition("=")
+            alternatives.append((found, written or found))
+        groups.append(alternatives)
+    return groups
+
+
+def template_error(from_text: str, to_text: str):
+    """הודעת שגיאה לכלל תבנית לא תקין, או None (גם לכלל רגיל)"""
+    if not is_template(from_text):
+        return None
+    groups = _template_groups(from_text)
+    if any(not found for alternatives in groups for found, _ in alternatives):
+        return "חלופה ריקה בתבנית"
+    if any(alternative.endswith("=") for match in TEMPLATE_GROUP.finditer(from_text)
+           for alternative in match.group(1).split("|")):
+        return "כתיב ריק אחרי = בתבנית"
+    placeholders = to_text.count(TEMPLATE_PLACEHOLDER)
+    if placeholders not in (0, len(groups)):
+        return f"ביעד {placeholders} מקומות {{}} אבל בתבנית {len(groups)} קבוצות חלופות"
+    forms = 1
+    for alternatives in groups:
+        forms *= len(alternatives)
+    if forms > MAX_TEMPLATE_FORMS:
+        return f"התבנית מייצרת {forms} צורות (המקסימום {MAX_TEMPLATE_FORMS})"
+    return None
+
+
+def expand_rule(from_text: str, to_text: str) -> list:
+    """
+    כל הצורות של כלל: רשימת (מקור, יעד).
+    כלל רגיל - הוא עצמו; כלל תבנית לא תקין נשאר כלל רגיל (מחרוזת מילולית).
+    """
+    if not is_template(from_text) or template_error(from_text, to_text):
+        return [(from_text, to_text)]
+    literals = TEMPLATE_GROUP.split(from_text)[::2]
+    target_literals = to_text.split(TEMPLATE_PLACEHOLDER)
+    forms = []
+    for choice in product(*_template_groups(from_text)):
+        source = literals[0] + "".join(found + literal for (found, _), literal in zip(choice, literals[1:]))
+        if len(target_literals) > 1:
+            target = target_literals[0] + "".join(
+                written + literal for (_, written), literal in zip(choice, target_literals[1:])
+            )
+        else:
+            target = to_text
+        forms.append((source, target))
+    return forms
+
+
+def parse_dictionary_file(content: str) -> list:
+    """
+    פענוח קובץ מילון בפורמט:
+    "מילה למציאה" "מילה להחלפה" [עדיפות]
+    """
+    entries = []
+    lines = content.strip().split('\n')
+    
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        match = RULE_LINE.match(line)
+        if match and template_error(match.group(1), match.group(2)) is None:
+            entry = {"from": match.group(1), "to": match.group(2)}
+            if match.group(3) and int(match.group(3)):
+                entry["priority"] = int(match.group(3))
+            entries.append(entry)
+    
+    return entries
+
+
+def parse_dictionary_file_detailed(content: str) -> list:
+    """
+    פענוח קובץ מילון עם זיהוי שורות תקינות ולא תקינות.
+    מחזיר רשימה של כל השורות עם סטטוס תקינות.
+    """
+    entries = []
+    lines = content.strip().split('\n')
+    
+    for line_num, line in enumerate(lines, start=1):
+        stripped = line.strip()
+        if not stripped:
+            continue
+        match = RULE_LINE.match(stripped)
+        if match:
+            error = template_error(match.group(1), match.group(2))
+            entries.append({
+                "line": line_num,
+                "from": match.group(1),
+                "to": match.group(2),
+                "priority": int(match.group(3) or 0),
+                "valid": error is None,
+                "error": error
+            })
+        else:
+            entries.append({
+                "line": line_num,
+                "from": stripped,
+                "to": "",
+                "priority": 0,
+                "valid": False,
+                "error": "השורה אינה בפורמט \"מקור\" \"יעד\""
+            })
+    
+    return entries
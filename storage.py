@@ -0,0 +1,412 @@
+"""
+אחסון נתוני הוצאות הספרים והמילונים - מסד SQLite מוטמע
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+from contextlib import closing
+from pathlib import Path
+from matcher import invalidate_matchers
+
+# הגדרות בסיסיות
+DATA_DIR = Path(__file__).parent / "data"
+PUBLISHERS_FILE = DATA_DIR / "publishers.json"
+DB_FILE = DATA_DIR / "publishers.db"
+
+# יצירת תיקיות אם לא קיימות
+DATA_DIR.mkdir(exist_ok=True)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS publishers (
+    name TEXT PRIMARY KEY,
+    description TEXT NOT NULL DEFAULT '',
+    position INTEGER NOT NULL,
+    content_hash TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS entries (
+    publisher TEXT NOT NULL REFERENCES publishers(name) ON DELETE CASCADE,
+    "from" TEXT NOT NULL,
+    "to" TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (publisher, "from")
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_by_position ON entries (publisher, position);
+CREATE TABLE IF NOT EXISTS deletion_history (
+    publisher TEXT NOT NULL REFERENCES publishers(name) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    "from" TEXT NOT NULL,
+    "to" TEXT NOT NULL,
+    deleted_at TEXT NOT NULL,
+    PRIMARY KEY (publisher, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_init_lock = threading.Lock()
+_initialized = False
+
+# הנתונים האחרונים שנקראו מהמסד, לפי מספר הגרסה (revision) של המסד
+_cache_lock = threading.Lock()
+_cached_revision = None
+_cached_data = None
+
+
+def _connect() -> sqlite3.Connection:
+    """פתיחת חיבור למסד (חיבור נפרד לכל קריאה - בטוח בין ה-threads של Streamlit)"""
+    global _initialized
+    conn = sqlite3.connect(DB_FILE, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                conn.execute("PRAGMA journal_mode = WAL")
+                conn.executescript(_SCHEMA)
+                _migrate_schema(conn)
+                _migrate_from_json(conn)
+                _initialized = True
+    return conn
+
+
+def _migrate_schema(conn: sqlite3.Connection):
+    """הוספת עמודות שנוספו לסכמה במסד שנוצר בגרסה קודמת"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(entries)")}
+    if "priority" not in columns:
+        conn.execute("ALTER TABLE entries ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
+
+
+def _entry_value(entry: dict) -> tuple:
+    """הערך של כלל (יעד, עדיפות) - להשוואה ולמיזוג"""
+    return entry["to"], entry.get("priority") or 0
+
+
+def _make_entry(from_text: str, to_text: str, priority: int = 0) -> dict:
+    """כלל במבנה של האפליקציה (העדיפות נשמרת במבנה רק אם נקבעה)"""
+    entry = {"from": from_text, "to": to_text}
+    if priority:
+        entry["priority"] = priority
+    return entry
+
+
+def _migrate_from_json(conn: sqlite3.Connection):
+    """העברה חד-פעמית של publishers.json הקיים למסד"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        migrated = conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_json'").fetchone()
+        if not migrated:
+            if PUBLISHERS_FILE.exists():
+                with open(PUBLISHERS_FILE, "r", encoding="utf-8") as f:
+                    _write_publishers(conn, json.load(f))
+            conn.execute("INSERT INTO meta (key, value) VALUES ('migrated_from_json', '1')")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _publisher_hash(publisher_data: dict) -> str:
+    """hash לתוכן הוצאה - הוצאה שלא השתנתה לא נכתבת מחדש"""
+    payload = json.dumps(
+        [
+            publisher_data.get("description", ""),
+            [[e["from"], e["to"]] + ([e["priority"]] if e.get("priority") else [])
+             for e in publisher_data.get("dictionary", [])],
+            [[h["from"], h["to"], h["deleted_at"]] for h in publisher_data.get("deletion_history", [])],
+        ],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _current_revision(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def _write_dictionary(conn: sqlite3.Connection, name: str, dictionary: list, base: list = None):
+    """
+    כתיבת המילון כהפרש מול המסד: upsert לשורות שהשתנו ומחיקה של שורות שהוסרו.
+    base - תוכן המילון הידוע במסד (אם ידוע), כדי לחסוך את קריאתו.
+    """
+    if base is not None:
+        existing = {}
+        for position, entry in enumerate(base):
+            existing.setdefault(entry["from"], (*_entry_value(entry), position))
+    else:
+        existing = {
+            row[0]: (row[1], row[2], row[3])
+            for row in conn.execute(
+                'SELECT "from", "to", priority, position FROM entries WHERE publisher = ?', (name,)
+            )
+        }
+    upserts = []
+    seen = set()
+    for position, entry in enumerate(dictionary):
+        from_text = entry["from"]
+        # כלל כפול (אותו מקור) - נשמר המופע הראשון
+        if from_text in seen:
+            continue
+        seen.add(from_text)
+        to_text, priority = _entry_value(entry)
+        if existing.get(from_text) != (to_text, priority, position):
+            upserts.append((name, from_text, to_text, position, priority))
+
+    removed = [(name, from_text) for from_text in existing if from_text not in seen]
+    if removed:
+        conn.executemany('DELETE FROM entries WHERE publisher = ? AND "from" = ?', removed)
+    if upserts:
+        conn.executemany(
+            'INSERT INTO entries (publisher, "from", "to", position, priority) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT (publisher, "from") DO UPDATE SET "to" = excluded."to", position = excluded.position, '
+            'priority = excluded.priority',
+            upserts,
+        )
+
+
+def _write_publishers(conn: sqlite3.Connection, data: dict, snapshot: dict = None):
+    """
+    כתיבת כל ההוצאות בתוך טרנזקציה פתוחה - רק הוצאות שהתוכן שלהן השתנה נכתבות.
+    snapshot - תוכן המסד הנוכחי מהזיכרון (אם עדכני): השוואה ישירה במקום חישוב hash.
+    """
+    stored = {row[0]: (row[1], row[2]) for row in conn.execute("SELECT name, content_hash, position FROM publishers")}
+    removed = [(name,) for name in stored if name not in data]
+    if removed:
+        conn.executemany("DELETE FROM publishers WHERE name = ?", removed)
+
+    for position, (name, publisher_data) in enumerate(data.items()):
+        base = snapshot.get(name) if snapshot is not None else None
+        if name in stored and base is not None and base == publisher_data:
+            digest = stored[name][0]
+        else:
+            digest = _publisher_hash(publisher_data)
+        if stored.get(name) != (digest, position):
+            conn.execute(
+                "INSERT INTO publishers (name, description, position, content_hash) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET description = excluded.description, "
+                "position = excluded.position, content_hash = excluded.content_hash",
+                (name, publisher_data.get("description", ""), position, digest),
+            )
+        if name in stored and stored[name][0] == digest:
+            continue
+
+        _write_dictionary(
+            conn, name, publisher_data.get("dictionary", []),
+            base["dictionary"] if base is not None else None,
+        )
+
+        # היסטוריית המחיקות מוגבלת ל-100 ערכים - נכתבת מחדש כולה
+        conn.execute("DELETE FROM deletion_history WHERE publisher = ?", (name,))
+        conn.executemany(
+            'INSERT INTO deletion_history (publisher, position, "from", "to", deleted_at) VALUES (?, ?, ?, ?, ?)',
+            [
+                (name, position, h["from"], h["to"], h["deleted_at"])
+                for position, h in enumerate(publisher_data.get("deletion_history", []))
+            ],
+        )
+
+    revision = _current_revision(conn) + 1
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES ('revision', ?) "
+        "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+        (str(revision),),
+    )
+    return revision
+
+
+def _read_publishers(conn: sqlite3.Connection) -> dict:
+    """קריאת כל ההוצאות מהמסד למבנה הנתונים של האפליקציה"""
+    data = {}
+    for name, description in conn.execute("SELECT name, description FROM publishers ORDER BY position"):
+        data[name] = {"description": description, "dictionary": [], "deletion_history": []}
+    for publisher, from_text, to_text, priority in conn.execute(
+        'SELECT publisher, "from", "to", priority FROM entries ORDER BY publisher, position'
+    ):
+        data[publisher]["dictionary"].append(_make_entry(from_text, to_text, priority))
+    for publisher, from_text, to_text, deleted_at in conn.execute(
+        'SELECT publisher, "from", "to", deleted_at FROM deletion_history ORDER BY publisher, position'
+    ):
+        data[publisher]["deletion_history"].append({"from": from_text, "to": to_text, "deleted_at": deleted_at})
+    return data
+
+
+def _copy_publishers(data: dict) -> dict:
+    """העתק עצמאי של הנתונים (כל סשן עורך את העותק שלו)"""
+    return {
+        name: {
+            "description": p.get("description", ""),
+            "dictionary": [dict(e) for e in p.get("dictionary", [])],
+            "deletion_history": [dict(h) for h in p.get("deletion_history", [])],
+        }
+        for name, p in data.items()
+    }
+
+
+class ConcurrentModificationError(Exception):
+    """שמירה על בסיס נתונים ישנים שמתנגשת בשינוי של עורך אחר באותם ערכים"""
+
+    def __init__(self, conflicts: list):
+        self.conflicts = conflicts
+        super().__init__("; ".join(conflicts))
+
+
+class PublishersData(dict):
+    """
+    נתוני ההוצאות כפי שנטענו, יחד עם גרסת המסד (revision) שממנה נטענו
+    ותמונת המצב של אותה גרסה - לזיהוי שמירה על בסיס נתונים ישנים ולמיזוג.
+    """
+
+    def __init__(self, data: dict, revision: int, base: dict):
+        super().__init__(data)
+        self.revision = revision
+        self.base = base
+
+
+def _merge_publisher(name: str, base: dict, mine: dict, theirs: dict, conflicts: list) -> dict:
+    """מיזוג תלת-כיווני של הוצאה אחת, ערך אחר ערך"""
+    empty = {"description": "", "dictionary": [], "deletion_history": []}
+    base = base or empty
+    if mine == base:
+        return theirs
+    if theirs == base:
+        return mine
+
+    description = theirs.get("description", "")
+    if mine.get("description", "") != base.get("description", ""):
+        if description not in (base.get("description", ""), mine.get("description", "")):
+            conflicts.append(f"{name}: התיאור שונה ע\"י עורך אחר")
+        description = mine.get("description", "")
+
+    # מילון: השינויים שלי (הוספה/עדכון/מחיקה) מוחלים על המצב הנוכחי
+    base_dict = {e["from"]: _entry_value(e) for e in base.get("dictionary", [])}
+    mine_dict = {e["from"]: _entry_value(e) for e in mine.get("dictionary", [])}
+    merged = {e["from"]: _entry_value(e) for e in theirs.get("dictionary", [])}
+    for from_text, value in mine_dict.items():
+        if base_dict.get(from_text) == value:
+            continue
+        current = merged.get(from_text)
+        if current is None and from_text in base_dict:
+            conflicts.append(f"{name}: הערך '{from_text}' שונה כאן ונמחק ע\"י עורך אחר")
+            continue
+        if current is not None and current != value and current != base_dict.get(from_text):
+            conflicts.append(f"{name}: הערך '{from_text}' שונה ע\"י עורך אחר")
+        merged[from_text] = value
+    for from_text, value in base_dict.items():
+        if from_text in mine_dict or from_text not in merged:
+            continue
+        if merged[from_text] != value:
+            conflicts.append(f"{name}: הערך '{from_text}' נמחק כאן ושונה ע\"י עורך אחר")
+        del merged[from_text]
+
+    # היסטוריית מחיקות: מחיקות חדשות שלי בראש הרשימה, שחזורים שלי מוסרים
+    def key(h):
+        return h["from"], h["to"], h["deleted_at"]
+
+    base_history = {key(h) for h in base.get("deletion_history", [])}
+    mine_history = {key(h) for h in mine.get("deletion_history", [])}
+    history = [h for h in mine.get("deletion_history", []) if key(h) not in base_history]
+    history += [
+        h for h in theirs.get("deletion_history", [])
+        if key(h) not in base_history or key(h) in mine_history
+    ]
+
+    return {
+        "description": description,
+        "dictionary": [_make_entry(f, t, p) for f, (t, p) in merged.items()],
+        "deletion_history": history[:100],
+    }
+
+
+def _merge_publishers(base: dict, mine: dict, theirs: dict) -> dict:
+    """
+    מיזוג שמירה שנעשתה על בסיס גרסה ישנה (base) עם המצב הנוכחי במסד (theirs).
+    שינויים שאינם חופפים מתמזגים; שינוי סותר של אותו ערך - ConcurrentModificationError.
+    """
+    conflicts = []
+    merged = {}
+    for name, theirs_data in theirs.items():
+        if name in mine:
+            merged[name] = _merge_publisher(name, base.get(name), mine[name], theirs_data, conflicts)
+        elif name in base:
+            # נמחקה כאן - מותר רק אם אף אחד לא שינה אותה בינתיים
+            if theirs_data != base[name]:
+                conflicts.append(f"{name}: ההוצאה נמחקה כאן ושונתה ע\"י עורך אחר")
+        else:
+            merged[name] = theirs_data
+    for name, mine_data in mine.items():
+        if name not in theirs and (name not in base or mine_data != base[name]):
+            # הוצאה חדשה שלי, או הוצאה שנמחקה ע"י אחר אחרי ששיניתי אותה
+            if name in base:
+                conflicts.append(f"{name}: ההוצאה נמחקה ע\"י עורך אחר")
+            merged[name] = mine_data
+    if conflicts:
+        raise ConcurrentModificationError(conflicts)
+    return merged
+
+
+def load_publishers() -> dict:
+    """
+    טעינת נתוני הוצאות הספרים (מהזיכרון, אם המסד לא השתנה מאז הקריאה האחרונה).
+    הנתונים מוחזרים כ-PublishersData עם הגרסה שממנה נטענו.
+    """
+    global _cached_revision, _cached_data
+    with closing(_connect()) as conn:
+        revision = _current_revision(conn)
+        with _cache_lock:
+            if revision == _cached_revision:
+                return PublishersData(_copy_publishers(_cached_data), revision, _cached_data)
+
+        conn.execute("BEGIN")
+        try:
+            revision = _current_revision(conn)
+            data = _read_publishers(conn)
+        finally:
+            conn.execute("COMMIT")
+
+    with _cache_lock:
+        _cached_revision, _cached_data = revision, data
+    return PublishersData(_copy_publishers(data), revision, data)
+
+
+def save_publishers(data: dict):
+    """
+    שמירת נתוני הוצאות הספרים - רק השורות שהשתנו, בטרנזקציה אחת (אטומית).
+    אם הנתונים נטענו מגרסה ישנה (עורך אחר שמר בינתיים), השינויים ממוזגים
+    ערך אחר ערך עם המצב הנוכחי; שינוי סותר של אותו ערך נדחה ב-ConcurrentModificationError.
+    לאחר שמירה מוצלחת data מתעדכן לתוכן שנשמר ולגרסה החדשה.
+    """
+    global _cached_revision, _cached_data
+    with closing(_connect()) as conn:
+        # BEGIN IMMEDIATE - נעילת כתיבה מראש, כך שבדיקת הגרסה והכתיבה אטומיות
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            current_revision = _current_revision(conn)
+            with _cache_lock:
+                snapshot = _cached_data if current_revision == _cached_revision else None
+
+            to_write = data
+            stale = isinstance(data, PublishersData) and data.revision != current_revision
+            if stale:
+                if snapshot is None:
+                    snapshot = _read_publishers(conn)
+                to_write = _merge_publishers(data.base, data, snapshot)
+            revision = _write_publishers(conn, to_write, snapshot)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    saved = _copy_publishers(to_write)
+    with _cache_lock:
+        _cached_revision, _cached_data = revision, saved
+    if isinstance(data, PublishersData):
+        if stale:
+            data.clear()
+            data.update(_copy_publishers(saved))
+        data.revision, data.base = revision, saved
+    invalidate_matchers(to_write)
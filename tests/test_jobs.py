@@ -0,0 +1,29 @@
+import time
+from jobs import JobQueue
+
+
+def wait(queue: JobQueue, jobs: list):
+    deadline = time.time() + 30
+    while not all(queue.get(job.id) is None or queue.get(job.id).finished for job in jobs):
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_finished_jobs_are_capped_per_session():
+    queue = JobQueue(max_workers=1, max_finished=2)
+    # קלט שאינו docx - העבודה נכשלת מיד, וגם עבודה שנכשלה נשמרת עד שהמגבלה מוחקת אותה
+    other = queue.submit("other.docx", b"not a docx", "בוקטיק", [], session="b")
+    busy = [queue.submit(f"{i}.docx", b"not a docx", "בוקטיק", [], session="a") for i in range(5)]
+    wait(queue, [other] + busy)
+    assert queue.get(other.id) is other
+    assert [job for job in busy if queue.get(job.id) is not None] == busy[-2:]
+
+
+def test_old_finished_jobs_expire():
+    queue = JobQueue(max_workers=1, max_age=0)
+    first = queue.submit("1.docx", b"not a docx", "בוקטיק", [], session="a")
+    wait(queue, [first])
+    time.sleep(0.01)
+    second = queue.submit("2.docx", b"not a docx", "בוקטיק", [], session="b")
+    wait(queue, [second])
+    assert queue.get(first.id) is None
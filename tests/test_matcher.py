@@ -0,0 +1,47 @@
+from matcher import DictionaryMatcher
+
+
+def test_normalized_match_does_not_split_accented_character():
+    matcher = DictionaryMatcher([{"from": "cafe", "to": "CAFE"}], normalize=True)
+    assert matcher.find_replacements("un café noir") == []
+    assert matcher.find_replacements("un cafe noir") == [(3, 7, "cafe", "CAFE")]
+
+
+def test_normalized_match_covers_niqqud():
+    matcher = DictionaryMatcher([{"from": "אי אפשר", "to": "אי־אפשר"}], normalize=True)
+    text = "זה אִי אֶפְשָׁר."
+    assert matcher.find_replacements(text) == [(3, len(text) - 1, "אי אפשר", "אי־אפשר")]
+
+
+def rules(*entries) -> list:
+    return [{"from": f, "to": t, **({"priority": p} if p else {})} for f, t, p in entries]
+
+
+def test_leftmost_match_wins_over_longer_overlapping_match():
+    matcher = DictionaryMatcher(rules(("אב", "1", 0), ("בגדה", "2", 0)))
+    found, dropped = matcher.scan("אבגדה")
+    assert found == [(0, 2, "אב", "1")]
+    assert dropped == 1
+
+
+def test_longest_match_wins_at_same_start():
+    matcher = DictionaryMatcher(rules(("שמונה עשר", "שמונה־עשר", 0), ("שמונה עשרה", "שמונה־עשרה", 0)))
+    assert matcher.find_replacements("בת שמונה עשרה.") == [(3, 13, "שמונה עשרה", "שמונה־עשרה")]
+    assert matcher.find_replacements("בן שמונה עשר.") == [(3, 12, "שמונה עשר", "שמונה־עשר")]
+
+
+def test_priority_beats_longer_match():
+    matcher = DictionaryMatcher(rules(("שמונה עשר", "18", 1), ("שמונה עשרה", "שמונה־עשרה", 0)))
+    assert matcher.find_replacements("שמונה עשרה") == [(0, 9, "שמונה עשר", "18")]
+
+
+def test_template_forms_with_equal_priority_take_smallest_target():
+    first = ("{שתיים=שתים|אחת} עשרה", "{}־עשרה", 0)
+    second = ("{שתיים|שלוש} עשרה", "{} עשרה!", 0)
+    for dictionary in (rules(first, second), rules(second, first)):
+        found = DictionaryMatcher(dictionary).find_replacements("שתיים עשרה")
+        assert found == [(0, 10, "שתיים עשרה", min("שתים־עשרה", "שתיים עשרה!"))]
+    # עדיפות גבוהה יותר גוברת על סדר היעדים
+    prioritized = (first[0], first[1], 2)
+    assert DictionaryMatcher(rules(second, prioritized)).find_replacements("שתיים עשרה") == [
+        (0, 10, "שתיים עשרה", "שתים־עשרה")]
@@ -0,0 +1,172 @@
+import re
+import zipfile
+from io import BytesIO
+import pytest
+from docx import Document
+from docx.oxml import parse_xml
+from lxml import etree
+from matcher import DictionaryMatcher
+from processing import BODY_LABEL, W_NS, TrackChangesEditor, process_docx_stream, process_document, read_story_parts
+
+W = f'{{{W_NS}}}'
+
+
+def paragraph(body: str):
+    return parse_xml(f'<w:p xmlns:w="{W_NS}">{body}</w:p>')
+
+
+def run(text: str, rpr: str = "") -> str:
+    return f'<w:r>{f"<w:rPr>{rpr}</w:rPr>" if rpr else ""}<w:t xml:space="preserve">{text}</w:t></w:r>'
+
+
+def edit(p, rules: dict, minimal_edits: bool = True):
+    matcher = DictionaryMatcher([{"from": f, "to": t} for f, t in rules.items()])
+    editor = TrackChangesEditor(matcher, minimal_edits=minimal_edits)
+    editor.process_paragraph(p, 1)
+    return editor
+
+
+def visible_text(p, accept: bool) -> str:
+    """הטקסט אחרי קבלת כל השינויים (accept) או דחייתם"""
+    skip, keep = (f'{W}del', f'{W}ins') if accept else (f'{W}ins', f'{W}del')
+    text = []
+    for el in p.iter(f'{W}t', f'{W}delText', f'{W}tab', f'{W}br'):
+        ancestors = {a.tag for a in el.iterancestors()}
+        if skip in ancestors:
+            continue
+        if el.tag == f'{W}tab':
+            text.append("\t")
+        elif el.tag == f'{W}br':
+            text.append("\n")
+        else:
+            text.append(el.text or "")
+    return "".join(text)
+
+
+@pytest.mark.parametrize("minimal_edits", [True, False])
+def test_accept_gives_replaced_text_and_reject_gives_original(minimal_edits):
+    p = paragraph(run("כבר ") + run("הי", "<w:b/>") + run("נה כאן, ") + run("אי אפשר"))
+    edit(p, {"הינה": "הנה", "אי אפשר": "אי־אפשר"}, minimal_edits)
+    assert visible_text(p, accept=True) == "כבר הנה כאן, אי־אפשר"
+    assert visible_text(p, accept=False) == "כבר הינה כאן, אי אפשר"
+
+
+def test_match_across_runs_keeps_each_run_format():
+    p = paragraph(run("א הי", "<w:b/>") + run("נה ב", "<w:i/>"))
+    edit(p, {"הינה": "הנה"})
+    deleted = [(r.findtext(f'{W}delText'), [c.tag for c in r.find(f'{W}rPr')])
+               for r in p.iter(f'{W}r') if r.getparent().tag == f'{W}del']
+    assert deleted == [("הי", [f'{W}b']), ("נה", [f'{W}i'])]
+    kept = [(r.findtext(f'{W}t'), [c.tag for c in r.find(f'{W}rPr')])
+            for r in p.iterchildren(f'{W}r')]
+    assert kept == [("א ", [f'{W}b']), (" ב", [f'{W}i'])]
+    inserted = p.find(f'{W}ins/{W}r')
+    assert inserted.findtext(f'{W}t') == "הנה"
+    assert [c.tag for c in inserted.find(f'{W}rPr')] == [f'{W}b']
+
+
+def test_tabs_breaks_and_bookmarks_stay_in_place():
+    p = paragraph(
+        '<w:r><w:t>א</w:t><w:tab/><w:t xml:space="preserve">הי</w:t></w:r>'
+        '<w:bookmarkStart w:id="0" w:name="mark"/>'
+        '<w:r><w:t xml:space="preserve">נה</w:t><w:br/><w:t>ב</w:t></w:r>'
+        '<w:bookmarkEnd w:id="0"/>'
+    )
+    edit(p, {"הינה": "הנה"})
+    assert visible_text(p, accept=True) == "א\tהנה\nב"
+    assert visible_text(p, accept=False) == "א\tהינה\nב"
+    order = [(el.tag, el.findtext(f'.//{W}delText') or el.findtext(f'.//{W}t')) for el in p]
+    assert order == [
+        (f'{W}r', "א"),
+        (f'{W}del', "הי"),
+        (f'{W}bookmarkStart', None),
+        (f'{W}del', "נה"),
+        (f'{W}ins', "הנה"),
+        (f'{W}r', "ב"),
+        (f'{W}bookmarkEnd', None),
+    ]
+    # הטאב נשאר ב-run שלפני ההתאמה, השבירה ב-run שאחריה
+    assert p[0].find(f'{W}tab') is not None
+    assert p[5].find(f'{W}br') is not None
+
+
+def test_paragraphs_do_not_share_rpr_elements():
+    matcher = DictionaryMatcher([{"from": "הינה", "to": "הנה"}])
+    editor = TrackChangesEditor(matcher, minimal_edits=True)
+    paragraphs = [paragraph(run("הינה ו", "<w:b/>") + run("הינה", "<w:i/>")) for _ in range(3)]
+    for idx, p in enumerate(paragraphs, 1):
+        editor.process_paragraph(p, idx)
+    for p in paragraphs:
+        runs = list(p.iter(f'{W}r'))
+        # כל run - מחוק, מוסף או שנשאר - עם עיצוב משלו, לא אחד שהועבר מפסקה אחרת
+        assert all(r.find(f'{W}rPr') is not None for r in runs)
+        assert [c.tag for r in p.iterchildren(f'{W}ins') for c in r.find(f'{W}r/{W}rPr')] == [
+            f'{W}b', f'{W}i']
+        assert visible_text(p, accept=False) == "הינה והינה"
+    # כל עיצוב מוסף הוא עותק: הפסקאות הבאות לא "גנבו" אותו
+    assert editor.stats.deepcopies >= 2 * len(paragraphs)
+
+
+FOOTNOTES_CT = "application/vnd.openxmlformats-officedocument.wordprocessingml.footnotes+xml"
+FOOTNOTES_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/footnotes"
+
+
+def make_story_docx(path):
+    """מסמך עם התאמות בגוף, בטבלה, בכותרת העליונה ובהערת שוליים"""
+    doc = Document()
+    doc.add_paragraph("הינה פסקה ראשונה, אי אפשר אחרת")
+    doc.add_paragraph("ללא התאמות")
+    table = doc.add_table(rows=2, cols=2)
+    table.cell(0, 0).text = "תא עם הינה"
+    table.cell(1, 1).text = "אי אפשר בתא"
+    doc.sections[0].header.paragraphs[0].text = "כותרת: הינה"
+    buffer = BytesIO()
+    doc.save(buffer)
+
+    footnotes = (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<w:footnotes xmlns:w="{W_NS}">'
+                 '<w:footnote w:id="1"><w:p><w:r><w:t xml:space="preserve">הערה: אי אפשר והינה</w:t></w:r></w:p>'
+                 '</w:footnote></w:footnotes>')
+    with zipfile.ZipFile(buffer) as zin, zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zout:
+        for info in zin.infolist():
+            data = zin.read(info)
+            if info.filename == "[Content_Types].xml":
+                data = data.replace(b"</Types>", f'<Override PartName="/word/footnotes.xml" '
+                                                 f'ContentType="{FOOTNOTES_CT}"/></Types>'.encode())
+            elif info.filename == "word/_rels/document.xml.rels":
+                data = data.replace(b"</Relationships>", f'<Relationship Id="rIdFootnotes" Type="{FOOTNOTES_REL}" '
+                                                         f'Target="footnotes.xml"/></Relationships>'.encode())
+            zout.writestr(info, data)
+        zout.writestr("word/footnotes.xml", footnotes)
+
+
+def canonical(data: bytes) -> bytes:
+    return etree.tostring(etree.fromstring(re.sub(rb'w:date="[^"]*"', b'', data)), method="c14n")
+
+
+@pytest.mark.parametrize("minimal_edits", [True, False])
+def test_streaming_engine_matches_process_document(tmp_path, minimal_edits):
+    source = tmp_path / "in.docx"
+    make_story_docx(source)
+    dictionary = [{"from": "הינה", "to": "הנה"}, {"from": "אי אפשר", "to": "אי־אפשר"}]
+
+    doc, changes = process_document(Document(source), dictionary, minimal_edits=minimal_edits)
+    expected = BytesIO()
+    doc.save(expected)
+    streamed = BytesIO()
+    stream_changes = process_docx_stream(source, streamed, dictionary, minimal_edits=minimal_edits)
+
+    assert stream_changes == changes
+    parts = {change["חלק"].split(" (")[0] for change in changes}
+    assert parts == {BODY_LABEL, "כותרת עליונה", "הערות שוליים"}
+    assert sum(change["חלק"] == BODY_LABEL for change in changes) == 4  # כולל שני תאי הטבלה
+
+    with zipfile.ZipFile(source) as zin, zipfile.ZipFile(expected) as z_doc, zipfile.ZipFile(streamed) as z_stream:
+        story_parts = read_story_parts(zin)
+        assert {"word/document.xml", "word/header1.xml", "word/footnotes.xml"} <= set(story_parts)
+        for name in zin.namelist():
+            if name in story_parts:
+                assert canonical(z_stream.read(name)) == canonical(z_doc.read(name)), name
+            else:
+                # שאר החבילה מועתקת כמו שהיא
+                assert z_stream.read(name) == zin.read(name), name
+        assert z_stream.testzip() is None
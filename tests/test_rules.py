@@ -0,0 +1,18 @@
+from rules import expand_rule, parse_dictionary_file_detailed, template_error
+
+
+def test_template_with_empty_written_form_is_rejected():
+    assert template_error("{א|ב=} x", "{} y") is not None
+    assert expand_rule("{א|ב=} x", "{} y") == [("{א|ב=} x", "{} y")]
+
+
+def test_valid_template_expands():
+    assert template_error("{שתיים=שתים|אחת} עשרה", "{}־עשרה") is None
+    assert expand_rule("{שתיים=שתים|אחת} עשרה", "{}־עשרה") == [
+        ("שתיים עשרה", "שתים־עשרה"), ("אחת עשרה", "אחת־עשרה")]
+
+
+def test_detailed_parser_reports_template_error():
+    entries = parse_dictionary_file_detailed('"הינה" "הנה"\n"{א|} x" "{}"')
+    assert [e["valid"] for e in entries] == [True, False]
+    assert entries[1]["error"] == "חלופה ריקה בתבנית"
@@ -0,0 +1,83 @@
+import multiprocessing
+import threading
+import pytest
+from storage import ConcurrentModificationError, _merge_publishers
+
+
+def publishers(*entries) -> dict:
+    return {"בוקטיק": {"description": "", "dictionary": [{"from": f, "to": t} for f, t in entries],
+                       "deletion_history": []}}
+
+
+def test_local_edit_of_remotely_deleted_entry_conflicts():
+    base = publishers(("הינה", "הנה"), ("אמא", "אימא"))
+    mine = publishers(("הינה", "הנה!"), ("אמא", "אימא"))
+    theirs = publishers(("אמא", "אימא"))
+    with pytest.raises(ConcurrentModificationError):
+        _merge_publishers(base, mine, theirs)
+
+
+def test_local_delete_of_remotely_edited_entry_conflicts():
+    base = publishers(("הינה", "הנה"), ("אמא", "אימא"))
+    mine = publishers(("אמא", "אימא"))
+    theirs = publishers(("הינה", "הנה!"), ("אמא", "אימא"))
+    with pytest.raises(ConcurrentModificationError):
+        _merge_publishers(base, mine, theirs)
+
+
+def test_independent_edits_merge():
+    base = publishers(("הינה", "הנה"), ("אמא", "אימא"))
+    mine = publishers(("הינה", "הנה!"), ("אמא", "אימא"))
+    theirs = publishers(("הינה", "הנה"), ("אמא", "אימא"), ("ראיון", "ריאיון"))
+    merged = _merge_publishers(base, mine, theirs)
+    assert {e["from"]: e["to"] for e in merged["בוקטיק"]["dictionary"]} == {
+        "הינה": "הנה!", "אמא": "אימא", "ראיון": "ריאיון"}
+
+
+def _concurrent_writer(db_file, worker: int, threads: int, writes: int):
+    """תהליך כותב: כמה threads, כל אחד טוען, מוסיף ערך ייחודי ושומר בלולאה"""
+    import storage
+    storage.DB_FILE = db_file
+    storage.PUBLISHERS_FILE = db_file.with_suffix(".json")
+    storage._initialized = False
+    storage._cached_revision = storage._cached_data = None
+
+    def write(thread: int):
+        for k in range(writes):
+            data = storage.load_publishers()
+            data["בוקטיק"]["dictionary"].append({"from": f"{worker}-{thread}-{k}", "to": "x"})
+            storage.save_publishers(data)
+
+    pool = [threading.Thread(target=write, args=(t,)) for t in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="נדרש fork")
+def test_concurrent_writers_keep_every_entry(tmp_path, monkeypatch):
+    import storage
+    db_file = tmp_path / "publishers.db"
+    monkeypatch.setattr(storage, "DB_FILE", db_file)
+    monkeypatch.setattr(storage, "PUBLISHERS_FILE", tmp_path / "publishers.json")
+    monkeypatch.setattr(storage, "_initialized", False)
+    monkeypatch.setattr(storage, "_cached_revision", None)
+    monkeypatch.setattr(storage, "_cached_data", None)
+    storage.save_publishers(publishers())
+
+    workers, threads, writes = 4, 3, 5
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=_concurrent_writer, args=(db_file, w, threads, writes))
+                 for w in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(120)
+        assert process.exitcode == 0
+
+    monkeypatch.setattr(storage, "_cached_revision", None)
+    sources = [e["from"] for e in storage.load_publishers()["בוקטיק"]["dictionary"]]
+    expected = {f"{w}-{t}-{k}" for w in range(workers) for t in range(threads) for k in range(writes)}
+    assert len(sources) == len(set(sources))
+    assert set(sources) == expected